@@ -6,30 +6,123 @@
 """
 
 import os
+import copy
+import json
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Annotated, Any, Dict, List, Mapping, Optional, Tuple
 from functools import lru_cache
 
-import yaml
-from pydantic import Field
-from pydantic_settings import BaseSettings
+from pydantic import Field, field_validator
+from pydantic_settings import BaseSettings, NoDecode
 
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent
 CONFIG_DIR = PROJECT_ROOT / "config"
 
+# YAML 解析结果缓存: 路径 -> (mtime_ns, size, 解析结果)
+_YAML_CACHE_MAX_ENTRIES = 16
+_yaml_cache: "OrderedDict[str, Tuple[int, int, Dict[str, Any]]]" = OrderedDict()
+
+# JSON 旁路缓存后缀（仅在 APP_CONFIG_CACHE=1 时启用，避免只读容器中写文件失败）
+_JSON_CACHE_SUFFIX = ".cache.json"
+
+
+def _json_cache_enabled() -> bool:
+    return os.environ.get("APP_CONFIG_CACHE", "0").strip().lower() in ("1", "true", "yes")
+
+
+def _read_json_cache(config_path: Path, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+    """读取与YAML同目录的JSON缓存，YAML 已修改时返回 None"""
+    cache_path = Path(str(config_path) + _JSON_CACHE_SUFFIX)
+    try:
+        cached = json.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    
+    if cached.get("yaml_mtime_ns") != stat.st_mtime_ns or cached.get("yaml_size") != stat.st_size:
+        return None
+    return cached.get("data")
+
+
+def _write_json_cache(config_path: Path, stat: os.stat_result, data: Dict[str, Any]) -> None:
+    """原子写入JSON缓存，写入失败不影响配置加载"""
+    cache_path = Path(str(config_path) + _JSON_CACHE_SUFFIX)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    payload = {
+        "yaml_mtime_ns": stat.st_mtime_ns,
+        "yaml_size": stat.st_size,
+        "data": data,
+    }
+    try:
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
 
 def load_yaml_config(config_path: Optional[Path] = None) -> Dict[str, Any]:
-    """加载YAML配置文件"""
+    """
+    加载YAML配置文件
+    
+    解析结果按 (路径, mtime, 文件大小) 缓存，文件未变化时不再重复解析；
+    返回深拷贝，调用方修改返回值不会污染缓存。
+    设置 APP_CONFIG_CACHE=1 时，还会在YAML旁写入 JSON 缓存供下次启动直接加载
+    """
     if config_path is None:
         config_path = CONFIG_DIR / "config.yaml"
     
-    if not config_path.exists():
+    try:
+        stat = os.stat(config_path)
+    except FileNotFoundError:
         return {}
     
-    with open(config_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+    key = str(config_path)
+    cached = _yaml_cache.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        _yaml_cache.move_to_end(key)
+        return copy.deepcopy(cached[2])
+    
+    use_json_cache = _json_cache_enabled()
+    parsed = _read_json_cache(config_path, stat) if use_json_cache else None
+    
+    if parsed is None:
+        # 仅在确实需要解析YAML时才导入 PyYAML（JSON 缓存命中时完全跳过）
+        import yaml
+        
+        # 优先使用 libyaml 的 C 实现，解析速度比纯 Python 版本快数倍
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        with open(config_path, "r", encoding="utf-8") as f:
+            parsed = yaml.load(f, Loader=loader) or {}
+        if use_json_cache:
+            _write_json_cache(config_path, stat, parsed)
+    
+    _yaml_cache[key] = (stat.st_mtime_ns, stat.st_size, parsed)
+    _yaml_cache.move_to_end(key)
+    while len(_yaml_cache) > _YAML_CACHE_MAX_ENTRIES:
+        _yaml_cache.popitem(last=False)
+    
+    return copy.deepcopy(parsed)
+
+
+def _parse_list_env(value: str) -> List[str]:
+    """解析列表类环境变量，支持 ["*"]、* 和 http://a.com,http://b.com 三种写法"""
+    value = value.strip()
+    # 尝试解析 JSON 数组格式
+    if value.startswith("["):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return [value]
+    # 单个 * 或逗号分隔的值
+    if value == "*":
+        return ["*"]
+    return [s.strip() for s in value.split(",")]
 
 
 class AppSettings(BaseSettings):
@@ -70,6 +163,23 @@ class ModelSettings(BaseSettings):
     )
     models_dir: str = Field(default="./models", alias="MODELS_DIR")
     device: str = Field(default="cuda", alias="DEVICE")
+    # GPU 推理精度: bfloat16 (默认) / float16 / float32，CPU 始终使用 float32
+    torch_dtype: str = Field(default="bfloat16", alias="TORCH_DTYPE")
+    # 注意力后端，留空使用 PyTorch SDPA；可选 flash / xformers 等 (需安装对应依赖)
+    attention_backend: str = Field(default="", alias="ATTENTION_BACKEND")
+    # 合并注意力 Q/K/V 投影为单个 GEMM（仅支持 fuse_qkv_projections 的模型）
+    fuse_qkv: bool = Field(default=False, alias="FUSE_QKV_PROJECTIONS")
+    # 空闲子模块卸载到 CPU: none (默认，常驻 GPU) / model / sequential (最省显存，速度最慢)
+    cpu_offload: str = Field(default="none", alias="MODEL_CPU_OFFLOAD")
+    # 扩散 transformer 权重量化: none (默认) / bf16 (不额外量化) / int8 (需安装 optimum-quanto)
+    quantize: str = Field(default="none", alias="MODEL_QUANTIZE")
+    # 是否对扩散 transformer 执行 torch.compile（首次推理需要额外编译时间）
+    torch_compile: bool = Field(default=False, alias="TORCH_COMPILE")
+    # torch.compile 后端: inductor (默认) 或 tensorrt (需安装 torch-tensorrt)
+    torch_compile_backend: str = Field(default="inductor", alias="TORCH_COMPILE_BACKEND")
+    # 模型热切换时使用轻量显存释放（仅在可用显存不足时才 gc + empty_cache）
+    hot_swap_fast: bool = Field(default=False, alias="MODEL_HOT_SWAP_FAST")
+    hot_swap_min_free_gb: float = Field(default=16.0, alias="MODEL_HOT_SWAP_MIN_FREE_GB")
     
     model_config = {"env_prefix": "", "extra": "ignore"}
 
@@ -87,6 +197,22 @@ class GenerationSettings(BaseSettings):
     max_inference_steps: int = Field(default=100)
     max_images_per_request: int = Field(default=4)
     max_batch_prompts: int = Field(default=10)
+    # 批量编辑单次送入 GPU 的最大提示数，实际值还会按剩余显存 / 单图显存估算收缩
+    max_gpu_batch: int = Field(default=4, alias="MAX_GPU_BATCH")
+    gpu_batch_item_gb: float = Field(default=3.0, alias="GPU_BATCH_ITEM_GB")
+    # 提示词编码 LRU 缓存容量（条），0 表示关闭
+    # 缓存随模型所在进程存活：thread 模式跨请求复用；process 模式每个任务一个新进程，仅在单个任务内有效
+    prompt_cache_size: int = Field(default=128, alias="PROMPT_CACHE_SIZE")
+    # 已解码上传图像的缓存上限（MB，按解码后 宽*高*通道数 计，按内容 sha256 去重），0 表示关闭
+    upload_image_cache_mb: int = Field(default=0, alias="UPLOAD_IMAGE_CACHE_MB")
+    
+    # 视频编码器（需安装 PyAV），如 h264_nvenc 硬件编码；留空或不可用时使用 diffusers 的 CPU 编码
+    video_codec: str = Field(default="", alias="VIDEO_CODEC")
+    
+    # torch.compile 启用时是否使用 CUDA Graph 捕获去噪步（捕获失败会自动回退）
+    cuda_graph_enabled: bool = Field(default=True, alias="CUDA_GRAPH_ENABLED")
+    # 线程模式启动时预热编译的宽高比（逗号分隔），应与实际请求的尺寸一致
+    warmup_aspect_ratios: str = Field(default="1:1", alias="WARMUP_ASPECT_RATIOS")
     
     model_config = {"env_prefix": "", "extra": "ignore"}
 
@@ -106,55 +232,57 @@ class SecuritySettings(BaseSettings):
     """安全配置"""
     
     max_upload_size_mb: int = Field(default=20, alias="MAX_UPLOAD_SIZE_MB")
-    allowed_image_types: List[str] = Field(
-        default=["image/jpeg", "image/png", "image/webp"]
+    # NoDecode: 由下方校验器统一解析，支持 JSON 数组、"*" 和逗号分隔三种写法
+    allowed_image_types: Annotated[List[str], NoDecode] = Field(
+        default=["image/jpeg", "image/png", "image/webp"],
+        alias="ALLOWED_IMAGE_TYPES",
     )
     
     # CORS
-    cors_origins: List[str] = Field(default=["*"])
+    cors_origins: Annotated[List[str], NoDecode] = Field(default=["*"], alias="CORS_ORIGINS")
     cors_allow_credentials: bool = Field(default=True, alias="CORS_ALLOW_CREDENTIALS")
-    cors_allow_methods: List[str] = Field(default=["*"])
-    cors_allow_headers: List[str] = Field(default=["*"])
+    cors_allow_methods: Annotated[List[str], NoDecode] = Field(default=["*"], alias="CORS_ALLOW_METHODS")
+    cors_allow_headers: Annotated[List[str], NoDecode] = Field(default=["*"], alias="CORS_ALLOW_HEADERS")
     
     # Rate Limiting
     rate_limit: RateLimitSettings = Field(default_factory=RateLimitSettings)
     
-    model_config = {"env_prefix": "", "extra": "ignore"}
+    model_config = {"env_prefix": "", "extra": "ignore", "populate_by_name": True}
     
-    def __init__(self, **data):
-        import json
-        
-        # 处理 CORS_ORIGINS 环境变量
-        if "CORS_ORIGINS" in os.environ:
-            cors_value = os.environ["CORS_ORIGINS"].strip()
-            # 尝试解析 JSON 数组格式，如 ["*"] 或 ["http://a.com"]
-            if cors_value.startswith("["):
-                try:
-                    data["cors_origins"] = json.loads(cors_value)
-                except json.JSONDecodeError:
-                    data["cors_origins"] = [cors_value]
-            # 单个 * 或逗号分隔的值
-            elif cors_value == "*":
-                data["cors_origins"] = ["*"]
-            else:
-                data["cors_origins"] = [s.strip() for s in cors_value.split(",")]
-        
-        # 处理 ALLOWED_IMAGE_TYPES 环境变量
-        if "ALLOWED_IMAGE_TYPES" in os.environ:
-            types_value = os.environ["ALLOWED_IMAGE_TYPES"].strip()
-            if types_value.startswith("["):
-                try:
-                    data["allowed_image_types"] = json.loads(types_value)
-                except json.JSONDecodeError:
-                    data["allowed_image_types"] = [types_value]
-            else:
-                data["allowed_image_types"] = [s.strip() for s in types_value.split(",")]
-        
-        # Handle nested rate_limit config if passed as dict
-        if "rate_limit" in data and isinstance(data["rate_limit"], dict):
-            data["rate_limit"] = RateLimitSettings(**data["rate_limit"])
-            
-        super().__init__(**data)
+    @classmethod
+    def settings_customise_sources(
+        cls,
+        settings_cls,
+        init_settings,
+        env_settings,
+        dotenv_settings,
+        file_secret_settings,
+    ):
+        # 本节所有字段均为环境变量优先于 config.yaml 传入的值：
+        # 原先仅 CORS_ORIGINS / ALLOWED_IMAGE_TYPES 如此，现扩展到 MAX_UPLOAD_SIZE_MB 与 CORS_ALLOW_*；
+        # rate_limit 由 RateLimitSettings 单独构造，不受此处影响
+        return env_settings, init_settings, dotenv_settings, file_secret_settings
+    
+    @field_validator(
+        "allowed_image_types",
+        "cors_origins",
+        "cors_allow_methods",
+        "cors_allow_headers",
+        mode="before",
+    )
+    @classmethod
+    def _parse_list(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return _parse_list_env(value)
+        return value
+    
+    @field_validator("rate_limit", mode="before")
+    @classmethod
+    def _build_rate_limit(cls, value: Any) -> Any:
+        # 以 BaseSettings 方式构造，使 RATE_LIMIT_* 环境变量同样生效
+        if isinstance(value, dict):
+            return RateLimitSettings(**value)
+        return value
 
 
 class EmailSettings(BaseSettings):
@@ -206,6 +334,9 @@ class TaskQueueSettings(BaseSettings):
     sync_timeout_seconds: int = Field(default=600, alias="SYNC_TIMEOUT_SECONDS")
     # 执行模式：thread (默认) 或 process
     execution_mode: str = Field(default="thread", alias="TASK_QUEUE_EXECUTION_MODE")
+    # 合批上限：GPU 空闲时将参数兼容的等待任务合并为一次推理，1 表示不合批
+    # （process 模式下整批在同一个推理子进程中执行）
+    batch_size: int = Field(default=1, alias="TASK_QUEUE_BATCH_SIZE")
     
     model_config = {"env_prefix": "", "extra": "ignore", "populate_by_name": True}
 
@@ -270,6 +401,14 @@ class StorageSettings(BaseSettings):
     # 文件保留天数（0表示永久保留）
     retention_days: int = Field(default=0, alias="STORAGE_RETENTION_DAYS")
     
+    # 输出图像格式: png (默认，无损) / jpeg / webp，有损格式编码更快、体积更小
+    output_format: str = Field(default="png", alias="STORAGE_OUTPUT_FORMAT")
+    # jpeg / webp 编码质量 (1-100)
+    output_quality: int = Field(default=92, ge=1, le=100, alias="STORAGE_OUTPUT_QUALITY")
+    
+    # PNG 压缩级别 (0-9)，默认 1：编码速度约为默认级别 6 的数倍，体积略增
+    png_compress_level: int = Field(default=1, ge=0, le=9, alias="STORAGE_PNG_COMPRESS_LEVEL")
+    
     model_config = {"env_prefix": "", "extra": "ignore"}
 
 
@@ -293,8 +432,8 @@ class Settings:
         self.storage = StorageSettings(**yaml_config.get("storage", {}))
         self.email = EmailSettings(**yaml_config.get("email", {}))
         
-        # 加载宽高比配置
-        self._aspect_ratios = yaml_config.get("aspect_ratios", {
+        # 加载宽高比配置（初始化时一次性规范化为 (宽, 高) 元组，避免每次读取时重建）
+        aspect_ratios_raw = yaml_config.get("aspect_ratios", {
             "1:1": [1024, 1024],
             "16:9": [1664, 928],
             "9:16": [928, 1664],
@@ -303,22 +442,28 @@ class Settings:
             "3:2": [1584, 1056],
             "2:3": [1056, 1584],
         })
+        self._aspect_ratios: Dict[str, Tuple[int, int]] = {
+            k: (int(v[0]), int(v[1])) for k, v in aspect_ratios_raw.items()
+        }
+        self._aspect_ratios_view: Mapping[str, Tuple[int, int]] = MappingProxyType(self._aspect_ratios)
+        self._default_size: Tuple[int, int] = (
+            self.generation.default_width,
+            self.generation.default_height,
+        )
     
     @property
-    def aspect_ratios(self) -> Dict[str, Tuple[int, int]]:
-        """获取支持的宽高比"""
-        return {k: tuple(v) for k, v in self._aspect_ratios.items()}
+    def aspect_ratios(self) -> Mapping[str, Tuple[int, int]]:
+        """获取支持的宽高比（只读视图）"""
+        return self._aspect_ratios_view
     
     def get_aspect_ratio_size(self, ratio: str) -> Tuple[int, int]:
         """根据宽高比获取尺寸"""
-        if ratio in self._aspect_ratios:
-            return tuple(self._aspect_ratios[ratio])
-        return (self.generation.default_width, self.generation.default_height)
+        return self._aspect_ratios.get(ratio, self._default_size)
 
 
 @lru_cache()
 def get_settings() -> Settings:
-    """获取配置单例"""
+    """获取配置单例（唯一入口，整个进程只解析一次环境变量和配置文件）"""
     return Settings()
 
 
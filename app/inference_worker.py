@@ -57,6 +57,12 @@ async def run_worker(task_type: str, args_file: str, output_file: str):
             # 注意：_run_text_to_image_inference 是同步函数，但在 worker 中直接调用即可
             result = _run_text_to_image_inference(**kwargs)
             
+        elif task_type == "text_to_image_batch":
+            # 合批任务：同一进程内一次推理完成多个文生图任务，结果按顺序返回
+            await model_manager._load_text_to_image_model()
+            from app.routers.text_to_image import _run_text_to_image_batch_inference
+            result = _run_text_to_image_batch_inference(kwargs["requests"])
+            
         elif task_type == "image_edit":
             await model_manager._load_image_edit_model()
             from app.routers.image_edit import _run_image_edit_inference
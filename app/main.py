@@ -61,18 +61,45 @@ async def custom_rate_limit_handler(request: Request, exc: RateLimitExceeded):
         content={"detail": message}
     )
 
+_CORS_SET_LOOKUP_THRESHOLD = 20
+
+
+class _FrozenSetCORSMiddleware(CORSMiddleware):
+    """使用 frozenset 匹配请求来源的 CORS 中间件"""
+    
+    def __init__(self, app, **kwargs):
+        super().__init__(app, **kwargs)
+        self._allow_origins_set = frozenset(self.allow_origins)
+    
+    def is_allowed_origin(self, origin: str) -> bool:
+        if self.allow_all_origins:
+            return True
+        if self.allow_origin_regex is not None and self.allow_origin_regex.fullmatch(origin):
+            return True
+        return origin in self._allow_origins_set
+
+
 async def cleanup_task():
-    """定期清理临时文件的后台任务"""
+    """
+    定期清理临时文件的后台任务
+    
+    启动时先执行一次，之后按 check_interval_minutes 间隔执行。
+    清理依据是文件年龄，文件创建/写入事件本身不会让文件过期，因此使用定时检查而非目录监听
+    """
+    interval_seconds = settings.cleanup.check_interval_minutes * 60
     while True:
-        await asyncio.sleep(settings.cleanup.check_interval_minutes * 60)
-        if settings.cleanup.enabled:
-            try:
-                cleanup_old_temp_files(max_age_hours=settings.cleanup.max_age_hours)
-                # 同时清理旧任务记录
-                task_queue = get_task_queue()
-                task_queue.cleanup_old_tasks(max_age_hours=settings.cleanup.max_age_hours)
-            except Exception as e:
-                logger.error(f"清理临时文件时出错: {e}")
+        try:
+            # 文件扫描与删除可能很慢（慢盘/NFS），放到线程中执行以免阻塞事件循环
+            await asyncio.to_thread(
+                cleanup_old_temp_files,
+                max_age_hours=settings.cleanup.max_age_hours,
+            )
+            # 同时清理旧任务记录
+            task_queue = get_task_queue()
+            task_queue.cleanup_old_tasks(max_age_hours=settings.cleanup.max_age_hours)
+        except Exception as e:
+            logger.error(f"清理临时文件时出错: {e}")
+        await asyncio.sleep(interval_seconds)
 
 
 @asynccontextmanager
@@ -86,6 +113,15 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     logger.info("Qwen Image Service 正在启动...")
     logger.info("=" * 50)
     
+    model_manager = get_model_manager()
+    
+    # 线程模式下在后台线程预热 diffusers 导入，与数据库初始化并行
+    preload_handle = None
+    if settings.task_queue.execution_mode != "process":
+        preload_handle = asyncio.create_task(
+            asyncio.to_thread(model_manager.preload_pipeline_classes)
+        )
+    
     # 初始化数据库
     if settings.auth.enabled:
         await init_database()
@@ -94,7 +130,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.info("用户认证已禁用")
     
     # 加载模型 (仅在线程模式下加载，进程模式由Worker按需加载)
-    model_manager = get_model_manager()
+    if preload_handle is not None:
+        try:
+            await preload_handle
+        except Exception as e:
+            logger.warning(f"预加载 diffusers 失败: {e}")
+    
     logger.info(f"当前任务执行模式: {settings.task_queue.execution_mode}")
     
     if settings.task_queue.execution_mode == "process":
@@ -111,6 +152,13 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     await task_queue.start()
     logger.info(f"任务队列已启动 | GPU数量: {task_queue.gpu_count} | 最大并行数: {task_queue.max_workers}")
     
+    # 线程模式下在推理线程中预热已编译的文生图模型（CUDA Graph 按线程记录）
+    if settings.task_queue.execution_mode != "process" and settings.models.torch_compile:
+        try:
+            await task_queue.run_on_each_worker(model_manager.warmup_text_to_image)
+        except Exception as e:
+            logger.warning(f"文生图模型预热失败: {e}")
+    
     # 启动清理任务
     cleanup_task_handle = None
     if settings.cleanup.enabled:
@@ -164,16 +212,22 @@ app.add_middleware(SlowAPIMiddleware)
 
 # 添加CORS中间件
 # 注意：当 allow_origins=["*"] 时，allow_credentials 必须为 False（CORS规范要求）
-cors_origins = settings.security.cors_origins
+cors_origins_set = frozenset(settings.security.cors_origins)
+cors_allow_all = "*" in cors_origins_set
 cors_credentials = settings.security.cors_allow_credentials
 
 # 如果 origins 包含 "*"，则不能使用 credentials
-if "*" in cors_origins:
+if cors_allow_all:
     cors_credentials = False
 
+# 来源列表较长时使用 frozenset 做 O(1) 匹配（默认实现按列表线性查找）
+cors_middleware_class = CORSMiddleware
+if not cors_allow_all and len(cors_origins_set) > _CORS_SET_LOOKUP_THRESHOLD:
+    cors_middleware_class = _FrozenSetCORSMiddleware
+
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
+    cors_middleware_class,
+    allow_origins=list(cors_origins_set),
     allow_credentials=cors_credentials,
     allow_methods=settings.security.cors_allow_methods,
     allow_headers=settings.security.cors_allow_headers,
@@ -189,6 +243,16 @@ app.include_router(info_router)
 app.include_router(tasks_router)
 
 
+# 根路径中的静态服务信息，启动时构建一次
+_ROOT_INFO = {
+    "name": settings.app.app_name,
+    "version": settings.app.app_version,
+    "docs": "/docs",
+    "health": "/health",
+    "auth_enabled": settings.auth.enabled,
+}
+
+
 @app.get("/")
 async def root():
     """根路径 - 返回服务信息"""
@@ -196,11 +260,7 @@ async def root():
     queue_info = task_queue.get_queue_info()
     
     return {
-        "name": settings.app.app_name,
-        "version": settings.app.app_version,
-        "docs": "/docs",
-        "health": "/health",
-        "auth_enabled": settings.auth.enabled,
+        **_ROOT_INFO,
         "task_queue": {
             "gpu_count": queue_info["gpu_count"],
             "max_workers": queue_info["max_workers"],
@@ -6,7 +6,8 @@
 
 from datetime import datetime
 from typing import AsyncGenerator, Optional
-import json
+
+import orjson
 
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
@@ -21,6 +22,11 @@ logger = get_logger(__name__)
 Base = declarative_base()
 
 
+def dump_parameters(params: dict) -> str:
+    """序列化任务参数（orjson 直接输出 UTF-8，中文不转义）"""
+    return orjson.dumps(params).decode("utf-8")
+
+
 class User(Base):
     """用户模型"""
     __tablename__ = "users"
@@ -91,14 +97,14 @@ class TaskHistory(Base):
         """获取参数字典"""
         if self.parameters:
             try:
-                return json.loads(self.parameters)
-            except json.JSONDecodeError:
+                return orjson.loads(self.parameters)
+            except orjson.JSONDecodeError:
                 return {}
         return {}
     
     def set_parameters(self, params: dict) -> None:
         """设置参数"""
-        self.parameters = json.dumps(params, ensure_ascii=False)
+        self.parameters = dump_parameters(params)
     
     def to_dict(self) -> dict:
         """转换为字典"""
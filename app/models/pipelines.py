@@ -4,43 +4,87 @@
 负责加载和管理AI模型的生命周期
 """
 
-from typing import Optional, Any
+import asyncio
+import importlib
+from functools import lru_cache
+from typing import Dict, Optional, Any, Tuple
 import torch
 
 from ..utils.logger import get_logger
 from ..config import settings
+from ..services.prompt_cache import install_prompt_cache, uninstall_prompt_cache
 
 logger = get_logger(__name__)
 
+# 各任务类型对应的 pipeline 类 (模块名, 类名)，首次使用时才导入
+_PIPELINE_CLASSES: Dict[str, Tuple[str, str]] = {
+    "text_to_image": ("diffusers", "DiffusionPipeline"),
+    "image_edit": ("diffusers", "QwenImageEditPlusPipeline"),
+    "text_to_video": ("diffusers", "CogVideoXPipeline"),
+    "image_to_video": ("diffusers", "CogVideoXImageToVideoPipeline"),
+}
+
+
+def _configure_torch_backends() -> None:
+    """
+    开启 TF32 矩阵乘、cuDNN 自动调优与 Flash/Memory-Efficient SDPA 内核
+    
+    Ampere 及以上架构 (A40/3090/4090) 上可在几乎不损失精度的情况下明显加速注意力与矩阵乘
+    """
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.enable_flash_sdp(True)
+    torch.backends.cuda.enable_mem_efficient_sdp(True)
+
+
+_TORCH_DTYPES = {
+    "bfloat16": torch.bfloat16,
+    "bf16": torch.bfloat16,
+    "float16": torch.float16,
+    "fp16": torch.float16,
+    "float32": torch.float32,
+    "fp32": torch.float32,
+}
+
+
+def _resolve_dtype(name: str) -> torch.dtype:
+    """将配置中的精度名称解析为 torch.dtype"""
+    dtype = _TORCH_DTYPES.get(name.lower())
+    if dtype is None:
+        raise ValueError(f"不支持的 TORCH_DTYPE: {name}")
+    return dtype
+
 
 class ModelManager:
     """
     模型管理器
     
-    单例模式，负责管理文生图、图像编辑、文生视频、图生视频模型的加载和推理。
+    通过 get_model_manager() 获取单例，负责管理文生图、图像编辑、文生视频、图生视频模型的加载和推理。
     核心逻辑：互斥加载 (Lazy Loading + Hot Swapping)
     """
     
-    _instance: Optional["ModelManager"] = None
-    
-    def __new__(cls) -> "ModelManager":
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
-    
     def __init__(self):
-        if self._initialized:
-            return
-        
         self._text_to_image_pipeline = None
+        self._text_to_image_compiled = False
         self._image_edit_pipeline = None
         self._video_pipeline = None # 复用，CogVideoX 的 T2V 和 I2V 管道对象不同
         self._current_video_model_type = None # "text_to_video" or "image_to_video"
+        # 串行化模型加载，避免并发请求重复执行卸载/加载
+        self._load_lock = asyncio.Lock()
+        # 已解析的 pipeline 类缓存
+        self._pipeline_classes: Dict[str, Any] = {}
+        
+        # 设备信息在初始化时一次性解析并缓存，避免每次访问都查询 CUDA 驱动
+        self.gpu_available: bool = torch.cuda.is_available()
+        self.gpu_count: int = torch.cuda.device_count() if self.gpu_available else 0
+        self.device: str = "cuda" if (settings.models.device == "cuda" and self.gpu_available) else "cpu"
+        # A40/3090/4090 推荐 bfloat16，数值范围与 fp32 一致，不会出现 fp16 的溢出 NaN
+        self.dtype: torch.dtype = _resolve_dtype(settings.models.torch_dtype) if self.device == "cuda" else torch.float32
         
-        self._device = None
-        self._dtype = None
-        self._initialized = True
+        if self.device == "cuda":
+            _configure_torch_backends()
     
     @property
     def text_to_image_pipeline(self) -> Optional[Any]:
@@ -54,25 +98,6 @@ class ModelManager:
     def video_pipeline(self) -> Optional[Any]:
         return self._video_pipeline
     
-    @property
-    def device(self) -> str:
-        if self._device is None:
-            if settings.models.device == "cuda" and torch.cuda.is_available():
-                self._device = "cuda"
-            else:
-                self._device = "cpu"
-        return self._device
-    
-    @property
-    def dtype(self) -> torch.dtype:
-        if self._dtype is None:
-            if self.device == "cuda":
-                # A40/3090/4090 推荐 bfloat16
-                self._dtype = torch.bfloat16
-            else:
-                self._dtype = torch.float32
-        return self._dtype
-    
     @property
     def is_text_to_image_loaded(self) -> bool:
         return self._text_to_image_pipeline is not None
@@ -85,13 +110,239 @@ class ModelManager:
     def is_video_model_loaded(self) -> bool:
         return self._video_pipeline is not None
     
-    @property
-    def gpu_available(self) -> bool:
-        return torch.cuda.is_available()
-    
-    @property
-    def gpu_count(self) -> int:
-        return torch.cuda.device_count() if self.gpu_available else 0
+    def get_pipeline_class(self, model_type: str) -> Any:
+        """解析并缓存指定任务类型的 pipeline 类"""
+        pipeline_class = self._pipeline_classes.get(model_type)
+        if pipeline_class is None:
+            module_name, class_name = _PIPELINE_CLASSES[model_type]
+            # diffusers 使用惰性模块，需通过 getattr 触发子模块导入
+            pipeline_class = getattr(importlib.import_module(module_name), class_name)
+            self._pipeline_classes[model_type] = pipeline_class
+        return pipeline_class
+
+    def preload_pipeline_classes(self, *model_types: str) -> None:
+        """
+        预先导入 pipeline 类（同步函数，适合放在线程中执行）
+        
+        diffusers 首次导入会连带加载 transformers/accelerate 等，耗时数百毫秒
+        """
+        for model_type in model_types or ("text_to_image", "image_edit"):
+            self.get_pipeline_class(model_type)
+
+    def _enable_memory_optimizations(self, pipeline: Any) -> None:
+        """
+        开启高效注意力与 VAE 切片/分块解码
+        
+        各 transformer 的注意力处理器默认已走 SDPA (Flash/Memory-Efficient 内核)；
+        配置 ATTENTION_BACKEND 时改用指定后端 (如 flash、xformers)。
+        不替换为通用 AttnProcessor2_0，Qwen 的双流联合注意力依赖其专用处理器
+        """
+        backend = settings.models.attention_backend
+        transformer = getattr(pipeline, "transformer", None)
+        if backend and transformer is not None:
+            try:
+                transformer.set_attention_backend(backend)
+                logger.info(f"注意力后端: {backend}")
+            except Exception as e:
+                logger.warning(f"设置注意力后端 {backend} 失败，使用默认 SDPA: {e}")
+        
+        vae = getattr(pipeline, "vae", None)
+        if vae is None:
+            return
+        # 切片逐张解码、分块解码大分辨率 latent，避免高分辨率/批量解码时 OOM
+        for method in ("enable_slicing", "enable_tiling"):
+            try:
+                getattr(vae, method)()
+            except Exception as e:
+                logger.warning(f"VAE Optimization Warning ({method}): {e}")
+
+    def _prepare_on_device(
+        self,
+        pipeline: Any,
+        device_map: Optional[str] = None,
+        optimize_transformer: bool = True,
+        cuda_graphs: Optional[bool] = None,
+    ) -> bool:
+        """
+        将 pipeline 放到 GPU，并依次执行 QKV 合并、量化与编译；返回是否已启用编译
+        
+        cuda_graphs 为 None 时按 CUDA_GRAPH_ENABLED 配置决定编译是否使用 CUDA Graph
+        
+        配置 MODEL_CPU_OFFLOAD 时改为挂载 accelerate offload 钩子，子模块仅在前向期间驻留 GPU。
+        offload 钩子与 torch.compile 的 CUDA Graph 不兼容，此时跳过编译
+        """
+        offload = settings.models.cpu_offload.lower()
+        use_offload = offload in ("model", "sequential") and not device_map
+        
+        # 多卡 device_map 已完成放置；否则移动到 GPU 并统一所有组件的精度
+        if not device_map and not use_offload:
+            pipeline.to(self.device, self.dtype)
+        
+        self._maybe_fuse_qkv(pipeline)
+        if optimize_transformer:
+            self._maybe_quantize(pipeline)
+        
+        if use_offload:
+            if offload == "model":
+                pipeline.enable_model_cpu_offload()
+            else:
+                pipeline.enable_sequential_cpu_offload()
+            logger.info(f"已启用 CPU offload: {offload}")
+            return False
+        
+        return optimize_transformer and self._maybe_compile(pipeline, cuda_graphs=cuda_graphs)
+
+    def _maybe_fuse_qkv(self, pipeline: Any) -> None:
+        """
+        按配置将注意力的 Q/K/V 投影合并为一次 GEMM
+        
+        仅对提供 fuse_qkv_projections 的 transformer 生效 (如 CogVideoX)，需在量化与编译之前执行
+        """
+        if not settings.models.fuse_qkv or self.device != "cuda":
+            return
+        
+        transformer = getattr(pipeline, "transformer", None)
+        if transformer is None or not hasattr(transformer, "fuse_qkv_projections"):
+            return
+        
+        try:
+            transformer.fuse_qkv_projections()
+            logger.info("已合并注意力 QKV 投影")
+        except Exception as e:
+            logger.warning(f"合并 QKV 投影失败: {e}")
+
+    def _maybe_quantize(self, pipeline: Any) -> None:
+        """
+        按配置对扩散 transformer 做 int8 权重量化
+        
+        VAE 与文本编码器对精度更敏感，保持原精度；量化失败时继续使用原精度权重
+        """
+        mode = settings.models.quantize.lower()
+        if mode in ("none", "bf16") or self.device != "cuda":
+            return
+        if mode != "int8":
+            logger.warning(f"不支持的 MODEL_QUANTIZE: {mode}，跳过量化")
+            return
+        
+        transformer = getattr(pipeline, "transformer", None)
+        if transformer is None:
+            return
+        
+        try:
+            from optimum.quanto import freeze, qint8, quantize
+            quantize(transformer, weights=qint8)
+            freeze(transformer)
+            logger.info("已对 transformer 启用 int8 权重量化")
+        except Exception as e:
+            logger.warning(f"transformer 量化失败，使用原精度权重: {e}")
+
+    def _maybe_compile(self, pipeline: Any, cuda_graphs: Optional[bool] = None) -> bool:
+        """
+        按配置对 pipeline 的 transformer 与 VAE 解码执行 torch.compile
+        
+        编译失败时回退到 eager 模式；返回是否已启用编译
+        """
+        if cuda_graphs is None:
+            cuda_graphs = settings.generation.cuda_graph_enabled
+
+        if not settings.models.torch_compile or self.device != "cuda":
+            return False
+        
+        transformer = getattr(pipeline, "transformer", None)
+        if transformer is None:
+            return False
+        
+        backend = settings.models.torch_compile_backend
+        try:
+            compile_kwargs = self._get_compile_kwargs(backend, cuda_graphs)
+            pipeline.transformer = torch.compile(transformer, **compile_kwargs)
+            vae = getattr(pipeline, "vae", None)
+            if vae is not None:
+                vae.decode = torch.compile(vae.decode, **compile_kwargs)
+            logger.info(f"已启用 torch.compile (transformer + vae.decode) | 后端: {backend}")
+            return True
+        except Exception as e:
+            pipeline.transformer = transformer
+            logger.warning(f"torch.compile 失败，使用 eager 模式: {e}")
+            return False
+
+    def _get_compile_kwargs(self, backend: str, cuda_graphs: bool) -> Dict[str, Any]:
+        """构建 torch.compile 参数"""
+        if backend == "inductor":
+            try:
+                import torch._inductor.config as inductor_config
+                inductor_config.conv_1x1_as_mm = True
+                inductor_config.coordinate_descent_tuning = True
+            except ImportError:
+                pass
+            # reduce-overhead 会在预热后用 CUDA Graph 捕获整步内核并复用静态输入输出缓冲区
+            mode = "reduce-overhead" if cuda_graphs else "default"
+            return {"backend": "inductor", "mode": mode, "fullgraph": False}
+        
+        if backend == "tensorrt":
+            # 导入 torch_tensorrt 会注册 "tensorrt" 编译后端，引擎在首次推理时按输入形状构建
+            import torch_tensorrt  # noqa: F401
+            return {
+                "backend": "tensorrt",
+                "fullgraph": False,
+                "options": {"enabled_precisions": {self.dtype}},
+            }
+        
+        raise ValueError(f"不支持的 torch.compile 后端: {backend}")
+
+    def _restore_eager(self, pipeline: Any) -> None:
+        """撤销 torch.compile，恢复原始 transformer 与 vae.decode"""
+        transformer = getattr(pipeline, "transformer", None)
+        if transformer is not None and hasattr(transformer, "_orig_mod"):
+            pipeline.transformer = transformer._orig_mod
+        vae = getattr(pipeline, "vae", None)
+        if vae is not None:
+            # 编译后的 decode 是实例属性，删除后恢复为类上定义的方法
+            vae.__dict__.pop("decode", None)
+
+    def warmup_text_to_image(self) -> None:
+        """
+        预热已编译的文生图 pipeline（同步函数）
+        
+        Inductor 的 CUDA Graph 按线程记录，需在实际执行推理的线程中调用；
+        仅适用于常驻的线程模式，进程模式每个任务使用新进程，预热只会增加单次任务耗时
+        """
+        if self._text_to_image_pipeline is None or not self._text_to_image_compiled:
+            return
+        self._warmup_compiled_text_to_image(self._text_to_image_pipeline)
+
+    def _warmup_compiled_text_to_image(self, pipeline: Any) -> None:
+        """预热已编译的文生图 pipeline，CUDA Graph 捕获失败时改用不含 CUDA Graph 的编译模式"""
+        if self._warmup_text_to_image(pipeline):
+            return
+        if not settings.generation.cuda_graph_enabled:
+            return
+        
+        logger.warning("CUDA Graph 模式预热失败，改用不含 CUDA Graph 的编译模式")
+        self._restore_eager(pipeline)
+        torch._dynamo.reset()
+        if self._maybe_compile(pipeline, cuda_graphs=False) and not self._warmup_text_to_image(pipeline):
+            self._restore_eager(pipeline)
+
+    def _warmup_text_to_image(self, pipeline: Any) -> bool:
+        """按 WARMUP_ASPECT_RATIOS 中的尺寸各执行一次短推理，使编译开销发生在启动阶段而不是用户请求中"""
+        ratios = [r.strip() for r in settings.generation.warmup_aspect_ratios.split(",") if r.strip()]
+        try:
+            for ratio in ratios:
+                width, height = settings.get_aspect_ratio_size(ratio)
+                with torch.inference_mode():
+                    pipeline(
+                        prompt="warmup",
+                        width=width,
+                        height=height,
+                        num_inference_steps=2,
+                        num_images_per_prompt=1,
+                    )
+                logger.info(f"文生图模型预热完成 ({ratio}, {width}x{height})")
+            return True
+        except Exception as e:
+            logger.warning(f"文生图模型预热失败: {e}")
+            return False
 
     def _unload_all_except(self, keep_type: str = None) -> None:
         """
@@ -103,13 +354,16 @@ class ModelManager:
         # 卸载文生图
         if keep_type != "text_to_image" and self._text_to_image_pipeline is not None:
             logger.info("正在卸载文生图模型以释放显存...")
+            uninstall_prompt_cache(self._text_to_image_pipeline)
             del self._text_to_image_pipeline
             self._text_to_image_pipeline = None
+            self._text_to_image_compiled = False
             unloaded = True
 
         # 卸载图像编辑
         if keep_type != "image_edit" and self._image_edit_pipeline is not None:
             logger.info("正在卸载图像编辑模型以释放显存...")
+            uninstall_prompt_cache(self._image_edit_pipeline)
             del self._image_edit_pipeline
             self._image_edit_pipeline = None
             unloaded = True
@@ -130,150 +384,203 @@ class ModelManager:
                 unloaded = True
 
         if unloaded and self.gpu_available:
+            if settings.models.hot_swap_fast:
+                self._release_cuda_memory_fast()
+            else:
+                gc.collect()
+                torch.cuda.empty_cache()
+                torch.cuda.synchronize()
+
+    def _release_cuda_memory_fast(self) -> None:
+        """
+        轻量显存释放
+        
+        diffusers pipeline 基本为树状引用（提示词缓存钩子只持有弱引用），del 后即可由引用计数回收；
+        被释放的显存块仍由 PyTorch 缓存分配器保留，可直接供下一个模型复用，
+        因此可用显存按 驱动空闲 + (已保留 - 已分配) 计算，
+        仅当其不足以加载下一个模型时才执行 gc.collect() + empty_cache()
+        """
+        import gc
+        torch.cuda.ipc_collect()
+        torch.cuda.synchronize()
+        
+        free_bytes, _ = torch.cuda.mem_get_info()
+        free_bytes += torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        if free_bytes < settings.models.hot_swap_min_free_gb * 1024 ** 3:
             gc.collect()
             torch.cuda.empty_cache()
-            torch.cuda.synchronize()
+
+    def _build_text_to_image_pipeline(self) -> Any:
+        """构建文生图 pipeline（同步函数，在线程中执行）"""
+        pipeline_class = self.get_pipeline_class("text_to_image")
+        
+        device_map = None
+        if self.device == "cuda" and self.gpu_count > 1:
+            device_map = "balanced"
+        
+        pipeline = pipeline_class.from_pretrained(
+            settings.models.text_to_image_model,
+            torch_dtype=self.dtype,
+            trust_remote_code=True,
+            device_map=device_map,
+            low_cpu_mem_usage=True,
+        )
+        install_prompt_cache(pipeline, settings.models.text_to_image_model)
+        
+        if self.device == "cuda":
+            # 显存优化
+            self._enable_memory_optimizations(pipeline)
+
+            # A40 48G 一般不需要 offload Qwen，显存较小时可通过 MODEL_CPU_OFFLOAD 开启
+            # 编译后的预热由 warmup_text_to_image() 在推理线程中执行
+            self._text_to_image_compiled = self._prepare_on_device(pipeline, device_map)
+        
+        return pipeline
 
     async def _load_text_to_image_model(self) -> None:
         """加载文生图模型"""
         if self._text_to_image_pipeline is not None:
             return
 
-        self._unload_all_except("text_to_image")
+        async with self._load_lock:
+            # 等待锁期间可能已被其他请求加载完成
+            if self._text_to_image_pipeline is not None:
+                return
+
+            self._unload_all_except("text_to_image")
         
-        try:
-            logger.info(f"正在加载文生图模型: {settings.models.text_to_image_model}")
-            from diffusers import DiffusionPipeline
+            try:
+                logger.info(f"正在加载文生图模型: {settings.models.text_to_image_model}")
+                # 权重加载耗时数十秒，放到线程中执行以免阻塞事件循环
+                self._text_to_image_pipeline = await asyncio.to_thread(self._build_text_to_image_pipeline)
+                logger.info("✅ 文生图模型加载完成")
             
-            device_map = None
-            if self.device == "cuda" and self.gpu_count > 1:
-                device_map = "balanced"
-            
-            self._text_to_image_pipeline = DiffusionPipeline.from_pretrained(
-                settings.models.text_to_image_model,
-                torch_dtype=self.dtype,
-                trust_remote_code=True,
-                device_map=device_map,
-            )
-            
-            if self.device == "cuda":
-                # 显存优化
-                try:
-                    self._text_to_image_pipeline.enable_vae_tiling()
-                    self._text_to_image_pipeline.enable_vae_slicing()
-                except Exception as e:
-                    logger.warning(f"VAE Optimization Warning: {e}")
-
-                if self.gpu_count == 1:
-                     # A40 48G 一般不需要 offload Qwen，但为了保险起见，如果不跑视频，可以常驻
-                     # 为了极致并发，这里暂时不开启 offload，除非显存真的很小
-                     # self._text_to_image_pipeline.enable_model_cpu_offload()
-                     pass
-                
-                # 移动到 GPU (如果是单卡且没开 offload)
-                if not device_map:
-                    self._text_to_image_pipeline.to(self.device)
-
-            logger.info("✅ 文生图模型加载完成")
-            
-        except Exception as e:
-            logger.error(f"文生图模型加载失败: {e}")
-            raise
+            except Exception as e:
+                logger.error(f"文生图模型加载失败: {e}")
+                raise
     
+    def _build_image_edit_pipeline(self) -> Any:
+        """构建图像编辑 pipeline（同步函数，在线程中执行）"""
+        pipeline_class = self.get_pipeline_class("image_edit")
+        
+        device_map = None
+        if self.device == "cuda" and self.gpu_count > 1:
+            device_map = "balanced"
+        
+        pipeline = pipeline_class.from_pretrained(
+            settings.models.image_edit_model,
+            torch_dtype=self.dtype,
+            trust_remote_code=True,
+            device_map=device_map,
+            low_cpu_mem_usage=True,
+        )
+        install_prompt_cache(pipeline, settings.models.image_edit_model)
+        
+        if self.device == "cuda":
+            self._enable_memory_optimizations(pipeline)
+            # 图像编辑没有启动预热与捕获失败回退，编译时不使用 CUDA Graph，避免捕获失败发生在用户请求中
+            self._prepare_on_device(pipeline, device_map, cuda_graphs=False)
+        
+        return pipeline
+
     async def _load_image_edit_model(self) -> None:
         """加载图像编辑模型"""
         if self._image_edit_pipeline is not None:
             return
 
-        self._unload_all_except("image_edit")
+        async with self._load_lock:
+            # 等待锁期间可能已被其他请求加载完成
+            if self._image_edit_pipeline is not None:
+                return
 
-        try:
-            logger.info(f"正在加载图像编辑模型: {settings.models.image_edit_model}")
-            from diffusers import QwenImageEditPlusPipeline
-            
-            device_map = None
-            if self.device == "cuda" and self.gpu_count > 1:
-                device_map = "balanced"
-            
-            self._image_edit_pipeline = QwenImageEditPlusPipeline.from_pretrained(
-                settings.models.image_edit_model,
-                torch_dtype=self.dtype,
-                trust_remote_code=True,
-                device_map=device_map,
-            )
-            
-            if self.device == "cuda":
-                try:
-                    self._image_edit_pipeline.enable_vae_tiling()
-                    self._image_edit_pipeline.enable_vae_slicing()
-                except Exception:
-                    pass
-                
-                if not device_map:
-                    self._image_edit_pipeline.to(self.device)
-
-            logger.info("✅ 图像编辑模型加载完成")
+            self._unload_all_except("image_edit")
+
+            try:
+                logger.info(f"正在加载图像编辑模型: {settings.models.image_edit_model}")
+                self._image_edit_pipeline = await asyncio.to_thread(self._build_image_edit_pipeline)
+                logger.info("✅ 图像编辑模型加载完成")
             
-        except Exception as e:
-            logger.error(f"图像编辑模型加载失败: {e}")
-            raise
+            except Exception as e:
+                logger.error(f"图像编辑模型加载失败: {e}")
+                raise
+
+    def _build_video_pipeline(self, model_type: str, model_name: str) -> Any:
+        """构建视频 pipeline（同步函数，在线程中执行）"""
+        pipeline_class = self.get_pipeline_class(model_type)
+        
+        pipeline = pipeline_class.from_pretrained(
+            model_name,
+            torch_dtype=self.dtype,
+            low_cpu_mem_usage=True,
+        )
+
+        # A40 优化
+        if self.device == "cuda":
+            self._enable_memory_optimizations(pipeline)
+            # A40 不需要 offload 5B 模型，显存较小时可通过 MODEL_CPU_OFFLOAD 开启
+            self._prepare_on_device(pipeline, optimize_transformer=False)
+        
+        return pipeline
 
     async def _load_text_to_video_model(self) -> None:
         """加载文生视频模型 (CogVideoX-5B)"""
         if self._video_pipeline is not None and self._current_video_model_type == "text_to_video":
             return
 
-        self._unload_all_except("text_to_video")
+        async with self._load_lock:
+            # 等待锁期间可能已被其他请求加载完成
+            if self._video_pipeline is not None and self._current_video_model_type == "text_to_video":
+                return
 
-        try:
-            logger.info(f"正在加载文生视频模型: {settings.models.text_to_video_model}")
-            from diffusers import CogVideoXPipeline
-            
-            self._video_pipeline = CogVideoXPipeline.from_pretrained(
-                settings.models.text_to_video_model,
-                torch_dtype=self.dtype
-            )
-
-            # A40 优化
-            if self.device == "cuda":
-                self._video_pipeline.enable_vae_slicing()
-                # self._video_pipeline.enable_model_cpu_offload() # A40 不需要 offload 5B 模型
-                self._video_pipeline.to(self.device)
-            
-            self._current_video_model_type = "text_to_video"
-            logger.info("✅ 文生视频模型加载完成")
+            self._unload_all_except("text_to_video")
 
-        except Exception as e:
-            logger.error(f"文生视频模型加载失败: {e}")
-            raise
+            try:
+                logger.info(f"正在加载文生视频模型: {settings.models.text_to_video_model}")
+                self._video_pipeline = await asyncio.to_thread(
+                    self._build_video_pipeline,
+                    "text_to_video",
+                    settings.models.text_to_video_model,
+                )
+                self._current_video_model_type = "text_to_video"
+                logger.info("✅ 文生视频模型加载完成")
+
+            except Exception as e:
+                logger.error(f"文生视频模型加载失败: {e}")
+                raise
 
     async def _load_image_to_video_model(self) -> None:
         """加载图生视频模型 (CogVideoX-5B-I2V)"""
         if self._video_pipeline is not None and self._current_video_model_type == "image_to_video":
             return
 
-        self._unload_all_except("image_to_video")
+        async with self._load_lock:
+            # 等待锁期间可能已被其他请求加载完成
+            if self._video_pipeline is not None and self._current_video_model_type == "image_to_video":
+                return
 
-        try:
-            logger.info(f"正在加载图生视频模型: {settings.models.image_to_video_model}")
-            from diffusers import CogVideoXImageToVideoPipeline
-            
-            self._video_pipeline = CogVideoXImageToVideoPipeline.from_pretrained(
-                settings.models.image_to_video_model,
-                torch_dtype=self.dtype
-            )
-
-            if self.device == "cuda":
-                self._video_pipeline.enable_vae_slicing()
-                # self._video_pipeline.enable_vae_tiling() # 某些版本I2V可能支持
-                self._video_pipeline.to(self.device)
-            
-            self._current_video_model_type = "image_to_video"
-            logger.info("✅ 图生视频模型加载完成")
+            self._unload_all_except("image_to_video")
 
-        except Exception as e:
-            logger.error(f"图生视频模型加载失败: {e}")
-            raise
+            try:
+                logger.info(f"正在加载图生视频模型: {settings.models.image_to_video_model}")
+                self._video_pipeline = await asyncio.to_thread(
+                    self._build_video_pipeline,
+                    "image_to_video",
+                    settings.models.image_to_video_model,
+                )
+                self._current_video_model_type = "image_to_video"
+                logger.info("✅ 图生视频模型加载完成")
+
+            except Exception as e:
+                logger.error(f"图生视频模型加载失败: {e}")
+                raise
+
+    async def load_models(self) -> None:
+        """
+        线程模式启动时加载常驻模型
+        
+        默认常驻文生图模型；其他模型由对应推理前按需加载（会卸载当前模型）
+        """
+        await self._load_text_to_image_model()
 
     async def unload_models(self) -> None:
         """卸载所有模型"""
@@ -287,11 +594,8 @@ class ModelManager:
         generator.manual_seed(seed)
         return generator
 
-# 全局单例
-_model_manager: Optional[ModelManager] = None
 
+@lru_cache(maxsize=1)
 def get_model_manager() -> ModelManager:
-    global _model_manager
-    if _model_manager is None:
-        _model_manager = ModelManager()
-    return _model_manager
\ No newline at end of file
+    """获取模型管理器单例"""
+    return ModelManager()
@@ -4,17 +4,18 @@
 提供用户注册、登录、Token 刷新、密码重置等接口
 """
 
+import asyncio
 from datetime import timedelta
 from typing import List, Optional
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
-from sqlalchemy import select
+from sqlalchemy import bindparam, delete, exists, not_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 
 from ..config import settings
-from ..models.database import User, get_db
+from ..models.database import TaskHistory, User, get_db
 from ..schemas.user import (
     UserCreate,
     UserLogin,
@@ -31,7 +32,6 @@ from ..services.auth import (
     get_current_user,
     get_current_active_user,
     get_current_admin_user,
-    get_user_by_username,
 )
 from ..utils.logger import get_logger
 from ..utils.rate_limit import limiter
@@ -40,6 +40,10 @@ from ..utils.email_utils import send_verification_email, send_password_reset_ema
 logger = get_logger(__name__)
 router = APIRouter(prefix="/auth", tags=["认证"])
 
+# 预构建的查询语句，各请求只绑定参数
+_SELECT_USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+_SELECT_USER_BY_TOKEN = select(User).where(User.verification_token == bindparam("token"))
+
 
 class PasswordResetRequest(BaseModel):
     email: str
@@ -71,9 +75,11 @@ async def register(
             detail="当前不允许用户注册"
         )
     
-    # 检查用户名是否已存在
-    existing_user = await get_user_by_username(db, user_data.username)
-    if existing_user:
+    # 检查用户名是否已存在（EXISTS 仅返回布尔值，无需加载整行）
+    username_taken = (await db.execute(
+        select(exists().where(User.username == user_data.username))
+    )).scalar()
+    if username_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
@@ -107,11 +113,14 @@ async def register(
     verification_token = uuid.uuid4().hex if settings.email.enabled else None
     is_verified = not settings.email.enabled # 如果未启用邮件，则自动验证通过
     
+    # bcrypt 哈希耗时约 100ms，放到线程中执行以免阻塞事件循环
+    hashed_password = await asyncio.to_thread(get_password_hash, user_data.password)
+    
     # 创建用户
     new_user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         is_active=True,
         is_admin=False,
         is_verified=is_verified,
@@ -195,9 +204,7 @@ async def forgot_password(
         raise HTTPException(status_code=400, detail="邮件服务未启用")
         
     email_lower = data.email.lower()
-    result = await db.execute(
-        select(User).where(User.email == email_lower)
-    )
+    result = await db.execute(_SELECT_USER_BY_EMAIL, {"email": email_lower})
     user = result.scalar_one_or_none()
     
     if not user or user.username != data.username:
@@ -228,16 +235,14 @@ async def reset_password(
     """
     重置密码 - 使用 Token
     """
-    result = await db.execute(
-        select(User).where(User.verification_token == data.token)
-    )
+    result = await db.execute(_SELECT_USER_BY_TOKEN, {"token": data.token})
     user = result.scalar_one_or_none()
     
     if not user:
         raise HTTPException(status_code=400, detail="无效或过期的重置链接")
         
     # 重置密码
-    user.hashed_password = get_password_hash(data.new_password)
+    user.hashed_password = await asyncio.to_thread(get_password_hash, data.new_password)
     user.verification_token = None # 清除 Token
     # 如果用户之前未验证，重置密码可视作已验证？通常是的，因为他们访问了邮箱
     if not user.is_verified:
@@ -257,9 +262,7 @@ async def verify_email(
     """
     验证邮箱
     """
-    result = await db.execute(
-        select(User).where(User.verification_token == token)
-    )
+    result = await db.execute(_SELECT_USER_BY_TOKEN, {"token": token})
     user = result.scalar_one_or_none()
     
     if not user:
@@ -292,9 +295,7 @@ async def resend_verification_email(
         raise HTTPException(status_code=400, detail="邮件服务未启用")
         
     email_lower = email.lower()
-    result = await db.execute(
-        select(User).where(User.email == email_lower)
-    )
+    result = await db.execute(_SELECT_USER_BY_EMAIL, {"email": email_lower})
     user = result.scalar_one_or_none()
     
     if not user:
@@ -339,13 +340,13 @@ async def update_me(
     # 更新邮箱
     if user_data.email is not None:
         # 检查邮箱是否已被使用
-        result = await db.execute(
-            select(User).where(
+        email_taken = (await db.execute(
+            select(exists().where(
                 User.email == user_data.email,
                 User.id != current_user.id
-            )
-        )
-        if result.scalar_one_or_none():
+            ))
+        )).scalar()
+        if email_taken:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="邮箱已被使用"
@@ -354,7 +355,7 @@ async def update_me(
     
     # 更新密码
     if user_data.password is not None:
-        current_user.hashed_password = get_password_hash(user_data.password)
+        current_user.hashed_password = await asyncio.to_thread(get_password_hash, user_data.password)
     
     await db.commit()
     await db.refresh(current_user)
@@ -374,14 +375,17 @@ async def change_password(
     修改密码
     """
     # 验证原密码
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    password_ok = await asyncio.to_thread(
+        verify_password, password_data.old_password, current_user.hashed_password
+    )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="原密码错误"
         )
     
     # 更新密码
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    current_user.hashed_password = await asyncio.to_thread(get_password_hash, password_data.new_password)
     await db.commit()
     
     logger.info(f"用户密码已修改: {current_user.username}")
@@ -422,27 +426,30 @@ async def toggle_user_active(
             detail="不能禁用自己"
         )
     
+    # 单条 UPDATE ... RETURNING 完成读取与切换
     result = await db.execute(
-        select(User).where(User.id == user_id)
+        update(User)
+        .where(User.id == user_id)
+        .values(is_active=not_(User.is_active))
+        .returning(User.username, User.is_active)
     )
-    user = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not user:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    user.is_active = not user.is_active
     await db.commit()
     
-    status_text = "启用" if user.is_active else "禁用"
-    logger.info(f"用户 {user.username} 已被{status_text}")
+    status_text = "启用" if row.is_active else "禁用"
+    logger.info(f"用户 {row.username} 已被{status_text}")
     
     return {
         "message": f"用户已{status_text}",
         "user_id": user_id,
-        "is_active": user.is_active,
+        "is_active": row.is_active,
     }
 
 
@@ -461,27 +468,30 @@ async def toggle_user_admin(
             detail="不能修改自己的管理员权限"
         )
     
+    # 单条 UPDATE ... RETURNING 完成读取与切换
     result = await db.execute(
-        select(User).where(User.id == user_id)
+        update(User)
+        .where(User.id == user_id)
+        .values(is_admin=not_(User.is_admin))
+        .returning(User.username, User.is_admin)
     )
-    user = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not user:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    user.is_admin = not user.is_admin
     await db.commit()
     
-    status_text = "设置为管理员" if user.is_admin else "取消管理员权限"
-    logger.info(f"用户 {user.username} 已被{status_text}")
+    status_text = "设置为管理员" if row.is_admin else "取消管理员权限"
+    logger.info(f"用户 {row.username} 已被{status_text}")
     
     return {
         "message": f"用户已{status_text}",
         "user_id": user_id,
-        "is_admin": user.is_admin,
+        "is_admin": row.is_admin,
     }
 
 
@@ -500,19 +510,24 @@ async def delete_user(
             detail="不能删除自己"
         )
     
+    # 与 ORM 删除行为保持一致：先解除该用户任务历史的关联，避免外键约束失败
+    await db.execute(
+        update(TaskHistory).where(TaskHistory.user_id == user_id).values(user_id=None)
+    )
+    
+    # DELETE ... RETURNING 一次完成存在性检查与删除
     result = await db.execute(
-        select(User).where(User.id == user_id)
+        delete(User).where(User.id == user_id).returning(User.username)
     )
-    user = result.scalar_one_or_none()
+    username = result.scalar_one_or_none()
     
-    if not user:
+    if username is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    username = user.username
-    await db.delete(user)
     await db.commit()
     
     logger.info(f"用户已删除: {username}")
@@ -11,6 +11,7 @@ import base64
 from typing import Dict, Any, List
 
 import torch
+import torch.nn.functional as F
 from PIL import Image
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, Response
 from fastapi.responses import FileResponse, JSONResponse
@@ -23,9 +24,11 @@ from ..services.auth import get_current_user
 from ..services.task_history import check_and_update_quota
 from ..utils.logger import get_logger
 from ..utils.image_utils import (
+    SavedImages,
     read_and_validate_image,
     save_images_to_temp,
     create_zip_from_images,
+    get_image_media_type,
 )
 from ..utils.memory_utils import cleanup_memory, log_memory_status
 
@@ -53,6 +56,53 @@ def _deserialize_images(serialized: List[str]) -> List[Image.Image]:
     return images
 
 
+def _get_gpu_batch_size(total: int) -> int:
+    """根据配置上限与当前剩余显存计算单次推理的批大小"""
+    limit = settings.generation.max_gpu_batch
+    if torch.cuda.is_available():
+        free_bytes, _ = torch.cuda.mem_get_info()
+        per_item = settings.generation.gpu_batch_item_gb * 1024 ** 3
+        limit = min(limit, int(free_bytes // per_item))
+    return max(1, min(limit, total))
+
+
+def _encode_edit_prompts(pipeline: Any, image: Image.Image, prompts: List[str]):
+    """
+    逐条编码提示词并按最长序列填充，返回 (prompt_embeds, prompt_embeds_mask)
+    
+    编辑 pipeline 的处理器要求每条文本各自对应一组参考图，无法用同一张图直接编码多条提示词，
+    因此先逐条编码，再以批量 prompt_embeds 一次性完成去噪
+    """
+    from diffusers.pipelines.qwenimage.pipeline_qwenimage_edit_plus import (
+        CONDITION_IMAGE_SIZE,
+        calculate_dimensions,
+    )
+    
+    # 与 pipeline 内部一致：文本编码使用缩放后的条件图
+    width, height = image.size
+    condition_width, condition_height = calculate_dimensions(CONDITION_IMAGE_SIZE, width / height)
+    condition_image = pipeline.image_processor.resize(image, condition_height, condition_width)
+    
+    embeds, masks = [], []
+    for prompt in prompts:
+        prompt_embeds, prompt_embeds_mask = pipeline.encode_prompt(
+            prompt=prompt,
+            image=[condition_image],
+            device=pipeline._execution_device,
+        )
+        if prompt_embeds_mask is None:
+            prompt_embeds_mask = torch.ones(
+                prompt_embeds.shape[:2], dtype=torch.long, device=prompt_embeds.device
+            )
+        embeds.append(prompt_embeds)
+        masks.append(prompt_embeds_mask)
+    
+    max_len = max(e.shape[1] for e in embeds)
+    prompt_embeds = torch.cat([F.pad(e, (0, 0, 0, max_len - e.shape[1])) for e in embeds])
+    prompt_embeds_mask = torch.cat([F.pad(m, (0, max_len - m.shape[1])) for m in masks])
+    return prompt_embeds, prompt_embeds_mask
+
+
 def _run_image_edit_inference(
     serialized_images: List[str],
     prompt: str,
@@ -79,7 +129,7 @@ def _run_image_edit_inference(
     # 获取随机数生成器
     generator = model_manager.get_generator(seed)
     
-    logger.info(f"[推理] 开始编辑图像 | prompt: {prompt[:50]}... | 输入图像数: {len(pil_images)}")
+    logger.info("[推理] 开始编辑图像 | prompt: %.50s... | 输入图像数: %d", prompt, len(pil_images))
     
     result = None
     output_images = None
@@ -116,7 +166,7 @@ def _run_image_edit_inference(
         del result
         result = None
         
-        logger.info(f"[推理] 图像编辑成功 | 数量: {len(output_images)}")
+        logger.info("[推理] 图像编辑成功 | 数量: %d", len(output_images))
         
         # 保存图像到持久化目录
         saved_images = save_images_to_temp(output_images, prefix="edited", user_id=user_id)
@@ -130,15 +180,14 @@ def _run_image_edit_inference(
         output_images = None
         
         if len(saved_images) == 1:
-            filepath, filename = saved_images[0]
+            filename = saved_images.names[0]
             return_value = {
-                "file_path": filepath,
-                "media_type": "image/png",
+                "file_path": saved_images.paths[0],
+                "media_type": get_image_media_type(filename),
                 "filename": filename,
             }
         else:
-            image_paths = [path for path, _ in saved_images]
-            zip_path = create_zip_from_images(image_paths, user_id=user_id)
+            zip_path = create_zip_from_images(saved_images.paths, user_id=user_id)
             
             return_value = {
                 "file_path": zip_path,
@@ -206,28 +255,51 @@ def _run_batch_edit_inference(
     # 获取随机数生成器
     generator = model_manager.get_generator(seed)
     
-    logger.info(f"[推理] 开始批量编辑 | 提示数: {len(prompt_list)}")
+    logger.info("[推理] 开始批量编辑 | 提示数: %d", len(prompt_list))
     
-    all_saved_images = []
+    all_saved_images = SavedImages()
+    total = len(prompt_list)
+    batch_size = _get_gpu_batch_size(total)
+    pipeline = model_manager.image_edit_pipeline
+    # 整个批量请求共用一个批次 ID，文件名按提示词序号区分
+    batch_id = uuid.uuid4().hex[:8]
     
     try:
-        for i, prompt in enumerate(prompt_list):
-            logger.info(f"[推理] 处理提示 {i+1}/{len(prompt_list)}: {prompt[:30]}...")
+        negative_embeds = negative_embeds_mask = None
+        if negative_prompt:
+            with torch.inference_mode():
+                negative_embeds, negative_embeds_mask = _encode_edit_prompts(
+                    pipeline, pil_image, [negative_prompt]
+                )
+        
+        # 按批大小切分提示词，每批只执行一次去噪循环
+        for start in range(0, total, batch_size):
+            chunk = prompt_list[start:start + batch_size]
+            logger.info("[推理] 处理提示 %d-%d/%d", start + 1, start + len(chunk), total)
             
             result = None
             output_images = None
             try:
                 with torch.inference_mode():
-                    result = model_manager.image_edit_pipeline(
+                    prompt_embeds, prompt_embeds_mask = _encode_edit_prompts(pipeline, pil_image, chunk)
+                    negative_kwargs = {}
+                    if negative_embeds is not None:
+                        negative_kwargs = {
+                            "negative_prompt_embeds": negative_embeds.expand(len(chunk), -1, -1),
+                            "negative_prompt_embeds_mask": negative_embeds_mask.expand(len(chunk), -1),
+                        }
+                    result = pipeline(
                         image=[pil_image],
-                        prompt=prompt,
-                        negative_prompt=negative_prompt if negative_prompt else None,
+                        prompt_embeds=prompt_embeds,
+                        prompt_embeds_mask=prompt_embeds_mask,
                         generator=generator,
                         true_cfg_scale=true_cfg_scale,
                         guidance_scale=1.0,
                         num_inference_steps=num_inference_steps,
                         num_images_per_prompt=1,
+                        **negative_kwargs,
                     )
+                    del prompt_embeds, prompt_embeds_mask
                 
                 # 复制图像列表
                 output_images = list(result.images)
@@ -238,9 +310,16 @@ def _run_batch_edit_inference(
                 del result
                 result = None
                 
-                # 保存结果到持久化目录
-                saved = save_images_to_temp(output_images, prefix=f"batch_{i}", user_id=user_id)
-                all_saved_images.extend(saved)
+                # 并行保存本批结果到持久化目录
+                all_saved_images.extend(
+                    save_images_to_temp(
+                        output_images,
+                        prefix="batch",
+                        user_id=user_id,
+                        start_index=start,
+                        batch_id=batch_id,
+                    )
+                )
                 
                 # 关闭输出图像
                 for img in output_images:
@@ -249,7 +328,7 @@ def _run_batch_edit_inference(
                 output_images.clear()
                 
             finally:
-                # 每次迭代后清理
+                # 每批结束后清理
                 if result is not None:
                     del result
                 if output_images is not None:
@@ -259,16 +338,15 @@ def _run_batch_edit_inference(
                 if torch.cuda.is_available():
                     torch.cuda.empty_cache()
         
-        logger.info(f"[推理] 批量编辑完成 | 总输出: {len(all_saved_images)}")
+        logger.info("[推理] 批量编辑完成 | 总输出: %d", len(all_saved_images))
         
         # 打包所有结果
-        image_paths = [path for path, _ in all_saved_images]
-        zip_path = create_zip_from_images(image_paths, user_id=user_id)
+        zip_path = create_zip_from_images(all_saved_images.paths, user_id=user_id)
         
         return {
             "file_path": zip_path,
             "media_type": "application/zip",
-            "filename": f"batch_edit_{uuid.uuid4().hex[:8]}.zip",
+            "filename": f"batch_edit_{batch_id}.zip",
         }
     finally:
         # 最终清理
@@ -345,7 +423,7 @@ async def edit_image(
             allowed, message, remaining = await check_and_update_quota(current_user.id, count=num_images)
             if not allowed:
                 raise HTTPException(status_code=429, detail=message)
-            logger.info(f"配额检查通过 | 用户: {current_user.username} | 消耗: {num_images} | 今日剩余: {remaining}")
+            logger.info("配额检查通过 | 用户: %s | 消耗: %d | 今日剩余: %s", current_user.username, num_images, remaining)
     
     # 验证图像数量
     if len(images) > 2:
@@ -367,7 +445,7 @@ async def edit_image(
     # 序列化图像以便在线程间传递
     serialized_images = _serialize_images(pil_images)
     
-    logger.info(f"收到图像编辑请求 | prompt: {prompt[:50]}... | async: {async_mode}")
+    logger.info("收到图像编辑请求 | prompt: %.50s... | async: %s", prompt, async_mode)
     
     task_queue = get_task_queue()
     
@@ -502,7 +580,7 @@ async def batch_edit(
             allowed, message, remaining = await check_and_update_quota(current_user.id, count=quota_count)
             if not allowed:
                 raise HTTPException(status_code=429, detail=message)
-            logger.info(f"配额检查通过 | 用户: {current_user.username} | 消耗: {quota_count} | 今日剩余: {remaining}")
+            logger.info("配额检查通过 | 用户: %s | 消耗: %d | 今日剩余: %s", current_user.username, quota_count, remaining)
     
     # 读取并验证图像
     pil_image = await read_and_validate_image(
@@ -514,7 +592,7 @@ async def batch_edit(
     # 序列化图像
     serialized_image = _serialize_images([pil_image])[0]
     
-    logger.info(f"收到批量编辑请求 | 提示数: {len(prompt_list)} | async: {async_mode}")
+    logger.info("收到批量编辑请求 | 提示数: %d | async: %s", len(prompt_list), async_mode)
     
     task_queue = get_task_queue()
     
@@ -3,20 +3,20 @@
 """
 
 from typing import Dict, Any, Optional
-import json
 import uuid
 from datetime import datetime
 import os
-import shutil
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models.database import get_db, TaskHistory
+from ..models.database import get_db, TaskHistory, dump_parameters
 from ..schemas.requests import ImageToVideoRequest
 from ..services.auth import get_current_user
 from ..services.task_queue import get_task_queue
 from ..utils.logger import get_logger
+from ..utils.video_utils import export_video
+from ..utils.image_utils import copy_upload_limited
 from ..config import settings
 from ..models.database import User
 from ..services.task_history import check_and_update_quota, get_task_history_by_id
@@ -39,7 +39,7 @@ def _run_image_to_video_inference(
     """
     try:
         from ..models.pipelines import get_model_manager
-        from diffusers.utils import export_to_video, load_image
+        from diffusers.utils import load_image
         
         manager = get_model_manager()
         pipe = manager.video_pipeline
@@ -55,7 +55,7 @@ def _run_image_to_video_inference(
         
         source_image = load_image(image_path)
         
-        logger.info(f"Starting image-to-video generation: {prompt}")
+        logger.info("Starting image-to-video generation: %s", prompt)
         
         frames = pipe(
             prompt=prompt,
@@ -83,7 +83,7 @@ def _run_image_to_video_inference(
         filename = f"i2v_{uuid.uuid4().hex}.mp4"
         file_path = os.path.join(output_dir, filename)
         
-        export_to_video(frames, file_path, fps=8)
+        export_video(frames, file_path, fps=8)
         
         return {
             "success": True,
@@ -145,8 +145,14 @@ async def create_image_to_video_task(
         filename = f"upload_{uuid.uuid4().hex}_{image.filename}"
         image_path = os.path.join(temp_dir, filename)
         
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        try:
+            with open(image_path, "wb") as buffer:
+                await copy_upload_limited(image, buffer, settings.security.max_upload_size_mb)
+        except BaseException:
+            # 超过大小限制、客户端断开或写入失败时删除已写入的部分文件
+            if os.path.exists(image_path):
+                os.unlink(image_path)
+            raise
             
     else:
         raise HTTPException(status_code=400, detail="必须提供 image 或 source_task_id")
@@ -176,7 +182,7 @@ async def create_image_to_video_task(
         prompt=prompt,
         negative_prompt=negative_prompt,
         status="pending",
-        parameters=json.dumps({
+        parameters=dump_parameters({
             "prompt": prompt,
             "source": "upload" if image else source_task_id,
             "num_frames": num_frames,
@@ -68,7 +68,7 @@ async def get_aspect_ratios():
     
     返回所有支持的图像宽高比及其对应的像素尺寸
     """
-    return settings.aspect_ratios
+    return dict(settings.aspect_ratios)
 
 
 @router.get("/memory")
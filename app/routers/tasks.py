@@ -29,6 +29,7 @@ from ..services.task_history import (
 )
 from ..schemas import TaskHistoryListResponse, TaskStatistics, UserQuotaResponse
 from ..utils.logger import get_logger
+from ..utils.image_utils import get_image_media_type
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/tasks", tags=["任务管理"])
@@ -346,7 +347,7 @@ async def get_task_result(
             if file_path.endswith(".zip"):
                 media_type = "application/zip"
             else:
-                media_type = "image/png"
+                media_type = get_image_media_type(file_path)
             
             filename = task_history.result_filename or os.path.basename(file_path)
             
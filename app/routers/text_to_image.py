@@ -5,8 +5,9 @@
 """
 
 import gc
+import random
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 import torch
 from fastapi import APIRouter, Depends, Form, HTTPException, Query, Response
@@ -19,13 +20,38 @@ from ..services import get_task_queue, TaskStatus
 from ..services.auth import get_current_user
 from ..services.task_history import check_and_update_quota
 from ..utils.logger import get_logger
-from ..utils.image_utils import save_images_to_temp, create_zip_from_images
+from ..utils.image_utils import (
+    SavedImages,
+    save_images_to_temp,
+    create_zip_from_images,
+    get_image_media_type,
+)
 from ..utils.memory_utils import cleanup_memory, log_memory_status
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/text-to-image", tags=["文生图"])
 
 
+def _package_saved_images(saved_images: SavedImages, user_id: int = None) -> Dict[str, Any]:
+    """单张图像直接返回，多张图像打包为 ZIP"""
+    if len(saved_images) == 1:
+        filename = saved_images.names[0]
+        return {
+            "file_path": saved_images.paths[0],
+            "media_type": get_image_media_type(filename),
+            "filename": filename,
+        }
+    
+    # 多张图像返回ZIP
+    zip_path = create_zip_from_images(saved_images.paths, user_id=user_id)
+    
+    return {
+        "file_path": zip_path,
+        "media_type": "application/zip",
+        "filename": f"generated_images_{uuid.uuid4().hex[:8]}.zip",
+    }
+
+
 def _run_text_to_image_inference(
     prompt: str,
     negative_prompt: str,
@@ -51,7 +77,7 @@ def _run_text_to_image_inference(
     # 获取随机数生成器
     generator = model_manager.get_generator(seed)
     
-    logger.info(f"[推理] 开始生成图像 | prompt: {prompt[:50]}... | size: {width}x{height}")
+    logger.info("[推理] 开始生成图像 | prompt: %.50s... | size: %dx%d", prompt, width, height)
     
     result = None
     images = None
@@ -80,7 +106,7 @@ def _run_text_to_image_inference(
         del result
         result = None
         
-        logger.info(f"[推理] 图像生成成功 | 数量: {len(images)}")
+        logger.info("[推理] 图像生成成功 | 数量: %d", len(images))
         
         # 保存图像到持久化目录（按用户组织）
         saved_images = save_images_to_temp(images, prefix="generated", user_id=user_id)
@@ -93,24 +119,7 @@ def _run_text_to_image_inference(
         del images
         images = None
         
-        if len(saved_images) == 1:
-            filepath, filename = saved_images[0]
-            return_value = {
-                "file_path": filepath,
-                "media_type": "image/png",
-                "filename": filename,
-            }
-        else:
-            # 多张图像返回ZIP
-            image_paths = [path for path, _ in saved_images]
-            zip_path = create_zip_from_images(image_paths, user_id=user_id)
-            
-            return_value = {
-                "file_path": zip_path,
-                "media_type": "application/zip",
-                "filename": f"generated_images_{uuid.uuid4().hex[:8]}.zip",
-            }
-        
+        return_value = _package_saved_images(saved_images, user_id)
         return return_value
         
     finally:
@@ -144,6 +153,85 @@ def _run_text_to_image_inference(
         log_memory_status("[文生图] 推理完成后")
 
 
+def _run_text_to_image_batch_inference(requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    合批执行多个文生图任务（同步函数，在线程池中运行）
+    
+    各任务的尺寸、步数、CFG、图像数量及是否有负面提示词一致（见合批键），
+    合并为一次 pipeline 调用，按任务顺序拆分结果
+    """
+    model_manager = get_model_manager()
+    
+    if not model_manager.is_text_to_image_loaded:
+        raise RuntimeError("文生图模型未加载")
+    
+    first = requests[0]
+    num_images = first["num_images"]
+    
+    # 每个任务独立的随机数生成器，保证指定种子的任务结果可复现
+    generators = []
+    for request in requests:
+        seed = request["seed"]
+        if seed == -1:
+            seed = random.randint(0, 2 ** 32 - 1)
+        generators.extend([model_manager.get_generator(seed)] * num_images)
+    
+    negative_prompts = None
+    if first["negative_prompt"]:
+        negative_prompts = [request["negative_prompt"] for request in requests]
+    
+    logger.info(
+        "[推理] 合批生成图像 | 任务数: %d | size: %dx%d", len(requests), first["width"], first["height"]
+    )
+    
+    result = None
+    images = None
+    
+    try:
+        with torch.inference_mode():
+            result = model_manager.text_to_image_pipeline(
+                prompt=[request["prompt"] for request in requests],
+                negative_prompt=negative_prompts,
+                width=first["width"],
+                height=first["height"],
+                num_inference_steps=first["num_inference_steps"],
+                true_cfg_scale=first["true_cfg_scale"],
+                generator=generators,
+                num_images_per_prompt=num_images,
+            )
+        
+        images = list(result.images)
+        del result
+        result = None
+        
+        logger.info("[推理] 合批生成成功 | 数量: %d", len(images))
+        
+        # 输出按提示词顺序排列，每个任务对应连续的 num_images 张
+        return_values = []
+        for index, request in enumerate(requests):
+            task_images = images[index * num_images:(index + 1) * num_images]
+            saved_images = save_images_to_temp(task_images, prefix="generated", user_id=request.get("user_id"))
+            return_values.append(_package_saved_images(saved_images, request.get("user_id")))
+        
+        return return_values
+    
+    finally:
+        if result is not None:
+            del result
+        if images is not None:
+            for img in images:
+                if hasattr(img, 'close'):
+                    img.close()
+            del images
+        del generators
+        
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        
+        log_memory_status("[文生图] 合批推理完成后")
+
+
 @router.post("", response_model=None)
 async def generate_image(
     prompt: str = Form(..., description="生成图像的描述文本"),
@@ -191,12 +279,12 @@ async def generate_image(
             allowed, message, remaining = await check_and_update_quota(current_user.id, count=num_images)
             if not allowed:
                 raise HTTPException(status_code=429, detail=message)
-            logger.info(f"配额检查通过 | 用户: {current_user.username} | 消耗: {num_images} | 今日剩余: {remaining}")
+            logger.info("配额检查通过 | 用户: %s | 消耗: %d | 今日剩余: %s", current_user.username, num_images, remaining)
     
     # 获取宽高比对应的尺寸
     width, height = settings.get_aspect_ratio_size(aspect_ratio)
     
-    logger.info(f"收到文生图请求 | prompt: {prompt[:50]}... | async: {async_mode}")
+    logger.info("收到文生图请求 | prompt: %.50s... | async: %s", prompt, async_mode)
     
     task_queue = get_task_queue()
     
@@ -227,6 +315,9 @@ async def generate_image(
         _task_type="text_to_image",
         _parameters=task_parameters,
         _user_id=current_user.id,
+        # 参数一致的等待任务可合并为一次推理
+        _batch_key=(width, height, num_inference_steps, true_cfg_scale, num_images, bool(negative_prompt)),
+        _batch_func=_run_text_to_image_batch_inference,
     )
     
     if async_mode:
@@ -274,4 +365,4 @@ async def generate_image(
 @router.get("/aspect-ratios")
 async def get_aspect_ratios():
     """获取支持的宽高比及其对应尺寸"""
-    return settings.aspect_ratios
+    return dict(settings.aspect_ratios)
@@ -3,7 +3,6 @@
 """
 
 from typing import Dict, Any
-import json
 import uuid
 from datetime import datetime
 import os
@@ -11,11 +10,12 @@ import os
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models.database import get_db, TaskHistory
+from ..models.database import get_db, TaskHistory, dump_parameters
 from ..schemas.requests import TextToVideoRequest
 from ..services.auth import get_current_user
 from ..services.task_queue import get_task_queue, TaskType
 from ..utils.logger import get_logger
+from ..utils.video_utils import export_video
 from ..config import settings
 from ..models.database import User
 from ..services.task_history import check_and_update_quota
@@ -37,7 +37,6 @@ def _run_text_to_video_inference(
     """
     try:
         from ..models.pipelines import get_model_manager
-        from diffusers.utils import export_to_video
         
         manager = get_model_manager()
         
@@ -49,7 +48,7 @@ def _run_text_to_video_inference(
             
         generator = manager.get_generator(seed)
         
-        logger.info(f"Starting text-to-video generation: {prompt}")
+        logger.info("Starting text-to-video generation: %s", prompt)
         
         frames = pipe(
             prompt=prompt,
@@ -77,7 +76,7 @@ def _run_text_to_video_inference(
         filename = f"t2v_{uuid.uuid4().hex}.mp4"
         file_path = os.path.join(output_dir, filename)
         
-        export_to_video(frames, file_path, fps=8)
+        export_video(frames, file_path, fps=8)
         
         return {
             "success": True,
@@ -131,7 +130,7 @@ async def create_text_to_video_task(
         prompt=request.prompt,
         negative_prompt=request.negative_prompt,
         status="pending",
-        parameters=json.dumps(request.model_dump()),
+        parameters=dump_parameters(request.model_dump()),
     )
     db.add(task_history)
     await db.commit()
@@ -4,6 +4,7 @@
 提供用户认证、Token 管理等功能
 """
 
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -11,7 +12,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
@@ -27,6 +28,10 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Bearer Token 认证
 security = HTTPBearer(auto_error=False)
 
+# 预构建的查询语句，各请求只绑定参数
+_SELECT_USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+_SELECT_USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
@@ -100,17 +105,13 @@ def decode_token(token: str) -> Optional[TokenData]:
 
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """根据用户名获取用户"""
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
+    result = await db.execute(_SELECT_USER_BY_USERNAME, {"username": username})
     return result.scalar_one_or_none()
 
 
 async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     """根据 ID 获取用户"""
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
+    result = await db.execute(_SELECT_USER_BY_ID, {"user_id": user_id})
     return result.scalar_one_or_none()
 
 
@@ -131,7 +132,8 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> O
     if not user:
         return None
     
-    if not verify_password(password, user.hashed_password):
+    # bcrypt 校验为 CPU 密集操作，放到线程中执行以免阻塞事件循环
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
         return None
     
     if not user.is_active:
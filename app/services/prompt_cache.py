@@ -0,0 +1,188 @@
+"""
+提示词编码缓存
+
+缓存文本编码器输出，相同提示词（及参考图）重复请求时跳过文本编码器前向
+"""
+
+import functools
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from ..config import settings
+from ..utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (prompt_embeds, prompt_embeds_mask)，均为 batch=1 的 CPU 张量
+_CacheEntry = Tuple[torch.Tensor, Optional[torch.Tensor]]
+
+
+def _image_digest(image: Any) -> Optional[str]:
+    """计算参考图摘要；无参考图返回空字符串，无法摘要的输入返回 None"""
+    if image is None:
+        return ""
+    images = image if isinstance(image, (list, tuple)) else [image]
+    digest = hashlib.sha256()
+    for img in images:
+        if not hasattr(img, "tobytes"):
+            return None
+        digest.update(f"{img.mode}:{img.size}".encode())
+        digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def _pad_cat(tensors: List[torch.Tensor]) -> torch.Tensor:
+    """将序列长度不同的张量在第 1 维补零后沿 batch 维拼接"""
+    max_len = max(t.shape[1] for t in tensors)
+    padded = []
+    for t in tensors:
+        pad = [0, 0] * (t.dim() - 2) + [0, max_len - t.shape[1]]
+        padded.append(F.pad(t, pad))
+    return torch.cat(padded)
+
+
+class PromptEmbeddingCache:
+    """
+    提示词编码 LRU 缓存
+
+    键为 (模型, 提示词 sha256, 参考图摘要, max_sequence_length)，值保存在 CPU（有 GPU 时使用锁页内存），
+    命中后以 non_blocking 方式拷回 GPU
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pin = torch.cuda.is_available()
+
+    def _get(self, key: tuple) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key: tuple, entry: _CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _to_host(self, tensor: Optional[torch.Tensor]) -> Optional[torch.Tensor]:
+        if tensor is None:
+            return None
+        tensor = tensor.detach().to("cpu")
+        return tensor.pin_memory() if self._pin else tensor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def encode(
+        self,
+        encode_prompt: Any,
+        model_id: str,
+        device: Any,
+        kwargs: Dict[str, Any],
+    ) -> Optional[Tuple[torch.Tensor, Optional[torch.Tensor]]]:
+        """
+        逐条查询/编码提示词并合并为批量结果
+
+        参考图无法摘要时返回 None，由调用方直接走原始编码
+        """
+        image_digest = _image_digest(kwargs.get("image"))
+        if image_digest is None:
+            return None
+
+        prompt = kwargs["prompt"]
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        num_images_per_prompt = kwargs.get("num_images_per_prompt", 1)
+        max_sequence_length = kwargs.get("max_sequence_length")
+
+        embeds, masks = [], []
+        for text in prompts:
+            key = (model_id, hashlib.sha256(text.encode("utf-8")).hexdigest(), image_digest, max_sequence_length)
+            entry = self._get(key)
+            if entry is None:
+                prompt_embeds, prompt_embeds_mask = encode_prompt(
+                    **{**kwargs, "prompt": text, "num_images_per_prompt": 1}
+                )
+                entry = (self._to_host(prompt_embeds), self._to_host(prompt_embeds_mask))
+                self._put(key, entry)
+            # 直接从锁页内存异步拷贝到 GPU，补零与拼接在设备上完成
+            embeds.append(entry[0].to(device, non_blocking=True))
+            masks.append(None if entry[1] is None else entry[1].to(device, non_blocking=True))
+
+        prompt_embeds = _pad_cat(embeds)
+        if all(m is None for m in masks) and len({e.shape[1] for e in embeds}) == 1:
+            prompt_embeds_mask = None
+        else:
+            masks = [
+                torch.ones(e.shape[:2], dtype=torch.long, device=e.device) if m is None else m
+                for e, m in zip(embeds, masks)
+            ]
+            prompt_embeds_mask = _pad_cat(masks)
+
+        if num_images_per_prompt > 1:
+            prompt_embeds = prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+            if prompt_embeds_mask is not None:
+                prompt_embeds_mask = prompt_embeds_mask.repeat_interleave(num_images_per_prompt, dim=0)
+
+        return prompt_embeds, prompt_embeds_mask
+
+
+_prompt_cache: Optional[PromptEmbeddingCache] = None
+
+
+def get_prompt_cache() -> PromptEmbeddingCache:
+    """获取提示词编码缓存单例"""
+    global _prompt_cache
+    if _prompt_cache is None:
+        _prompt_cache = PromptEmbeddingCache(settings.generation.prompt_cache_size)
+    return _prompt_cache
+
+
+def install_prompt_cache(pipeline: Any, model_id: str) -> None:
+    """
+    为 pipeline 的 encode_prompt 挂载缓存
+
+    仅拦截以关键字传入 prompt 的调用；已传入 prompt_embeds 时直接走原始实现。
+    包装函数只持有 pipeline 的弱引用与类上的原始函数，不形成引用环，
+    卸载 pipeline 后仍可由引用计数立即回收
+    """
+    cache = get_prompt_cache()
+    if cache.maxsize <= 0 or not hasattr(pipeline, "encode_prompt"):
+        return
+
+    encode_prompt = type(pipeline).encode_prompt
+    pipeline_ref = weakref.ref(pipeline)
+
+    @functools.wraps(encode_prompt)
+    def cached_encode_prompt(*args, **kwargs):
+        pipe = pipeline_ref()
+        if pipe is None:
+            raise RuntimeError("Pipeline has been released")
+        if args or kwargs.get("prompt") is None or kwargs.get("prompt_embeds") is not None:
+            return encode_prompt(pipe, *args, **kwargs)
+        device = kwargs.get("device") or pipe._execution_device
+        result = cache.encode(functools.partial(encode_prompt, pipe), model_id, device, kwargs)
+        if result is None:
+            return encode_prompt(pipe, *args, **kwargs)
+        return result
+
+    # 实例属性覆盖类方法
+    pipeline.encode_prompt = cached_encode_prompt
+    logger.info(f"已启用提示词编码缓存 | 模型: {model_id} | 容量: {cache.maxsize}")
+
+
+def uninstall_prompt_cache(pipeline: Any) -> None:
+    """移除 install_prompt_cache 挂载的实例属性，恢复类上的 encode_prompt"""
+    if pipeline is not None:
+        vars(pipeline).pop("encode_prompt", None)
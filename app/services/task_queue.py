@@ -10,6 +10,7 @@
 
 import asyncio
 import gc
+import threading
 import uuid
 import time
 import json
@@ -106,6 +107,12 @@ class Task:
     negative_prompt: Optional[str] = None
     parameters: Optional[Dict[str, Any]] = None
     user_id: Optional[int] = None
+    
+    # 合批执行：batch_key 相同的等待任务可由 batch_func 一次性执行
+    # batch_func 接收各任务 kwargs 组成的列表，按相同顺序返回结果列表；
+    # 进程模式下由推理子进程以 "<task_type>_batch" 任务类型执行
+    batch_key: Optional[tuple] = None
+    batch_func: Optional[Callable] = None
 
 
 class TaskQueue:
@@ -208,6 +215,29 @@ class TaskQueue:
         
         logger.info(f"任务队列已启动 | 工作者数量: {self._max_workers}")
     
+    async def run_on_each_worker(self, func: Callable[[], Any]) -> None:
+        """
+        在线程池的每个推理线程上各执行一次 func（依次执行，不并发）
+        
+        用于预热等需要在推理线程内完成的初始化（如按线程记录的 CUDA Graph）
+        """
+        if not self._running or self._executor is None:
+            raise RuntimeError("任务队列未启动")
+        
+        # 屏障使每次提交占用不同的线程，锁保证 func 依次执行
+        barrier = threading.Barrier(self._max_workers)
+        lock = threading.Lock()
+        
+        def run() -> None:
+            barrier.wait()
+            with lock:
+                func()
+        
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, run) for _ in range(self._max_workers))
+        )
+    
     async def stop(self) -> None:
         """停止任务队列"""
         if not self._running:
@@ -260,12 +290,18 @@ class TaskQueue:
                 if semaphore:
                     await semaphore.acquire()
                 
+                # 在 GPU 空闲时取出，合入等待期间到达的同类任务
+                batch = self._take_batch(task)
                 try:
-                    await self._execute_task(task, gpu_id)
+                    if len(batch) > 1:
+                        await self._execute_batch(batch, gpu_id)
+                    else:
+                        await self._execute_task(task, gpu_id)
                 finally:
                     if semaphore:
                         semaphore.release()
-                    self._queue.task_done()
+                    for _ in batch:
+                        self._queue.task_done()
                 
             except asyncio.CancelledError:
                 break
@@ -285,87 +321,24 @@ class TaskQueue:
         # 更新数据库状态
         await self._update_task_in_db(task.task_id, status="running", started_at=task_result.started_at)
         
-        logger.info(f"开始执行任务 {task.task_id} | GPU: {gpu_id if self._gpu_count > 0 else 'CPU'} | Mode: {settings.task_queue.execution_mode}")
+        logger.info(
+            "开始执行任务 %s | GPU: %s | Mode: %s",
+            task.task_id,
+            gpu_id if self._gpu_count > 0 else "CPU",
+            settings.task_queue.execution_mode,
+        )
         
         try:
             result = None
             
             # 模式 1: 独立进程模式 (彻底释放内存)
             if settings.task_queue.execution_mode == "process":
-                import sys
-                import json
-                import tempfile
-                import os
-                
-                # 准备参数文件
                 # 注入 GPU ID 到参数中
                 if self._gpu_count > 0:
                     task.kwargs["_gpu_id"] = gpu_id
-                    
-                # 创建临时参数文件
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as tmp:
-                    json.dump(task.kwargs, tmp)
-                    args_file = tmp.name
                 
-                # 创建临时输出文件
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as tmp_out:
-                    output_file = tmp_out.name
-
-                try:
-                    # 构建命令
-                    cmd = [
-                        sys.executable,
-                        "-m", "app.inference_worker",
-                        "--task-type", task.task_type or "text_to_image", # 默认为 text_to_image 如果未指定
-                        "--args-file", args_file,
-                        "--output-file", output_file
-                    ]
-                    
-                    logger.debug(f"Executing subprocess: {' '.join(cmd)}")
-                    
-                    # 运行子进程
-                    proc = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
-                    )
-                    
-                    logger.info(f"Worker subprocess started | PID: {proc.pid} | Task: {task.task_id}")
-                    
-                    stdout, stderr = await proc.communicate()
-                    
-                    logger.info(f"Worker subprocess finished | PID: {proc.pid} | Return Code: {proc.returncode}")
-                    
-                    if proc.returncode != 0:
-                        error_msg = stderr.decode().strip()
-                        logger.error(f"Worker process failed (code {proc.returncode}): {error_msg}")
-                        raise RuntimeError(f"Worker process error: {error_msg}")
-                        
-                    # 读取输出文件
-                    try:
-                        with open(output_file, 'r', encoding='utf-8') as f:
-                            content = f.read().strip()
-                            if not content:
-                                raise ValueError("Empty output file")
-                            worker_output = json.loads(content)
-                    except Exception as e:
-                        logger.error(f"Failed to read/parse worker output from {output_file}: {e}")
-                        # 尝试从 stdout/stderr 获取更多信息
-                        logger.error(f"STDOUT: {stdout.decode().strip()}")
-                        logger.error(f"STDERR: {stderr.decode().strip()}")
-                        raise RuntimeError(f"Failed to get result from worker: {e}")
-                        
-                    if worker_output.get("status") == "failed":
-                        raise RuntimeError(worker_output.get("error", "Unknown worker error"))
-                        
-                    result = worker_output.get("result")
-                    
-                finally:
-                    # 清理临时文件
-                    if os.path.exists(args_file):
-                        os.unlink(args_file)
-                    if os.path.exists(output_file):
-                        os.unlink(output_file)
+                # 默认为 text_to_image 如果未指定
+                result = await self._run_worker_process(task.task_type or "text_to_image", task.kwargs, task.task_id)
 
             # 模式 2: 线程池模式 (默认, 响应快但内存不释放)
             else:
@@ -381,74 +354,237 @@ class TaskQueue:
                     lambda: task.func(*task.args, **task.kwargs)
                 )
             
-            # 更新状态为完成
-            task_result.status = TaskStatus.COMPLETED
-            task_result.result = result
-            task_result.completed_at = datetime.now()
-            
-            # 提取结果路径和文件名
-            result_path = None
-            result_filename = None
-            if isinstance(result, dict):
-                # 支持多种键名: file_path, path, output_path
-                result_path = result.get("file_path") or result.get("path") or result.get("output_path")
-                result_filename = result.get("filename")
-            elif isinstance(result, str):
-                result_path = result
-                import os
-                result_filename = os.path.basename(result)
+            await self._complete_task(task.task_id, task_result, result)
             
-            task_result.result_path = result_path
-            task_result.result_filename = result_filename
+        except Exception as e:
+            await self._fail_task(task.task_id, task_result, e)
+        
+        finally:
+            # 任务执行完成后强制清理内存（额外保障）
+            self._cleanup_after_task(task.task_id)
+    
+    async def _run_worker_process(self, task_type: str, kwargs: Dict[str, Any], task_id: str) -> Any:
+        """在独立的推理子进程中执行任务，返回 worker 输出的结果"""
+        import sys
+        import tempfile
+        import os
+        
+        # 创建临时参数文件
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as tmp:
+            json.dump(kwargs, tmp)
+            args_file = tmp.name
+        
+        # 创建临时输出文件
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as tmp_out:
+            output_file = tmp_out.name
+
+        try:
+            # 构建命令
+            cmd = [
+                sys.executable,
+                "-m", "app.inference_worker",
+                "--task-type", task_type,
+                "--args-file", args_file,
+                "--output-file", output_file
+            ]
             
-            # 计算执行时间
-            execution_time = (task_result.completed_at - task_result.started_at).total_seconds()
+            logger.debug("Executing subprocess: %s", cmd)
             
-            # 更新数据库
-            await self._update_task_in_db(
-                task.task_id,
-                status="completed",
-                completed_at=task_result.completed_at,
-                result_path=result_path,
-                result_filename=result_filename,
-                execution_time=execution_time
+            # 运行子进程
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
             
-            logger.info(f"任务 {task.task_id} 执行成功")
+            logger.info("Worker subprocess started | PID: %s | Task: %s", proc.pid, task_id)
             
-        except Exception as e:
-            # 更新状态为失败
-            task_result.status = TaskStatus.FAILED
-            task_result.error = str(e)
-            task_result.completed_at = datetime.now()
+            stdout, stderr = await proc.communicate()
             
-            # 计算执行时间
-            execution_time = None
-            if task_result.started_at:
-                execution_time = (task_result.completed_at - task_result.started_at).total_seconds()
+            logger.info("Worker subprocess finished | PID: %s | Return Code: %s", proc.pid, proc.returncode)
             
-            # 更新数据库
-            await self._update_task_in_db(
-                task.task_id,
-                status="failed",
-                completed_at=task_result.completed_at,
-                error_message=str(e),
-                execution_time=execution_time
-            )
+            if proc.returncode != 0:
+                error_msg = stderr.decode().strip()
+                logger.error(f"Worker process failed (code {proc.returncode}): {error_msg}")
+                raise RuntimeError(f"Worker process error: {error_msg}")
+                
+            # 读取输出文件
+            try:
+                with open(output_file, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+                    if not content:
+                        raise ValueError("Empty output file")
+                    worker_output = json.loads(content)
+            except Exception as e:
+                logger.error(f"Failed to read/parse worker output from {output_file}: {e}")
+                # 尝试从 stdout/stderr 获取更多信息
+                logger.error(f"STDOUT: {stdout.decode().strip()}")
+                logger.error(f"STDERR: {stderr.decode().strip()}")
+                raise RuntimeError(f"Failed to get result from worker: {e}")
+                
+            if worker_output.get("status") == "failed":
+                raise RuntimeError(worker_output.get("error", "Unknown worker error"))
+                
+            return worker_output.get("result")
             
-            logger.error(f"任务 {task.task_id} 执行失败: {e}")
+        finally:
+            # 清理临时文件
+            if os.path.exists(args_file):
+                os.unlink(args_file)
+            if os.path.exists(output_file):
+                os.unlink(output_file)
+
+    def _take_batch(self, task: Task) -> List[Task]:
+        """
+        从队列中取出与 task 可合批的等待任务
+        
+        其余任务按原顺序放回队列；整个过程没有 await，不会与其他协程交错
+        """
+        limit = settings.task_queue.batch_size
+        if limit <= 1 or task.batch_func is None:
+            return [task]
+        
+        batch = [task]
+        remaining = []
+        while not self._queue.empty():
+            queued = self._queue.get_nowait()
+            queued_result = self._tasks.get(queued.task_id)
+            if (
+                len(batch) < limit
+                and queued.batch_key == task.batch_key
+                and queued_result is not None
+                and queued_result.status == TaskStatus.PENDING
+            ):
+                batch.append(queued)
+            else:
+                remaining.append(queued)
         
+        for queued in remaining:
+            self._queue.put_nowait(queued)
+            # 放回时 put 会增加未完成计数，这里抵消
+            self._queue.task_done()
+        
+        return batch
+    
+    async def _execute_batch(self, tasks: List[Task], gpu_id: int) -> None:
+        """合批执行多个任务，结果按顺序分发给各任务"""
+        # 与 _execute_task 一致：跳过已没有结果记录的任务
+        pairs = [(task, self._tasks.get(task.task_id)) for task in tasks]
+        pairs = [(task, task_result) for task, task_result in pairs if task_result is not None]
+        if not pairs:
+            return
+        tasks = [task for task, _ in pairs]
+        task_results = [task_result for _, task_result in pairs]
+        
+        try:
+            started_at = datetime.now()
+            for task, task_result in pairs:
+                task_result.status = TaskStatus.RUNNING
+                task_result.started_at = started_at
+                await self._update_task_in_db(task.task_id, status="running", started_at=started_at)
+                if self._gpu_count > 0:
+                    task.kwargs["_gpu_id"] = gpu_id
+            
+            logger.info("开始合批执行 %d 个任务 | GPU: %s", len(tasks), gpu_id if self._gpu_count > 0 else "CPU")
+            
+            batch_kwargs = [task.kwargs for task in tasks]
+            if settings.task_queue.execution_mode == "process":
+                # 整批在同一个推理子进程中执行，模型只加载一次
+                results = await self._run_worker_process(
+                    f"{tasks[0].task_type}_batch", {"requests": batch_kwargs}, tasks[0].task_id
+                )
+            else:
+                loop = asyncio.get_event_loop()
+                results = await loop.run_in_executor(
+                    self._executor,
+                    tasks[0].batch_func,
+                    batch_kwargs,
+                )
+            if len(results) != len(tasks):
+                # 结果与任务无法一一对应时整批失败，避免部分任务一直停留在运行状态
+                raise RuntimeError(f"合批结果数量不匹配: 期望 {len(tasks)}，实际 {len(results)}")
+        except Exception as e:
+            # 任何环节失败时整批任务均记为失败，避免被合入的任务停留在等待/运行状态
+            for task, task_result in pairs:
+                await self._fail_task(task.task_id, task_result, e)
+            return
         finally:
-            # 任务执行完成后强制清理内存（额外保障）
-            try:
-                gc.collect()
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                    # 同步确保内存完全释放
-                    torch.cuda.synchronize()
-                log_memory_status(f"[任务队列] 任务 {task.task_id[:8]} 完成后")
-            except Exception as cleanup_error:
-                logger.warning(f"内存清理时发生警告: {cleanup_error}")
+            self._cleanup_after_task(tasks[0].task_id)
+        
+        for task, task_result, result in zip(tasks, task_results, results, strict=True):
+            await self._complete_task(task.task_id, task_result, result)
+    
+    async def _complete_task(self, task_id: str, task_result: TaskResult, result: Any) -> None:
+        """记录任务成功结果"""
+        # 更新状态为完成
+        task_result.status = TaskStatus.COMPLETED
+        task_result.result = result
+        task_result.completed_at = datetime.now()
+        
+        # 提取结果路径和文件名
+        result_path = None
+        result_filename = None
+        if isinstance(result, dict):
+            # 支持多种键名: file_path, path, output_path
+            result_path = result.get("file_path") or result.get("path") or result.get("output_path")
+            result_filename = result.get("filename")
+        elif isinstance(result, str):
+            result_path = result
+            import os
+            result_filename = os.path.basename(result)
+        
+        task_result.result_path = result_path
+        task_result.result_filename = result_filename
+        
+        # 计算执行时间
+        execution_time = (task_result.completed_at - task_result.started_at).total_seconds()
+        
+        # 更新数据库
+        await self._update_task_in_db(
+            task_id,
+            status="completed",
+            completed_at=task_result.completed_at,
+            result_path=result_path,
+            result_filename=result_filename,
+            execution_time=execution_time
+        )
+        
+        logger.info("任务 %s 执行成功", task_id)
+    
+    async def _fail_task(self, task_id: str, task_result: TaskResult, error: Exception) -> None:
+        """记录任务失败"""
+        # 更新状态为失败
+        task_result.status = TaskStatus.FAILED
+        task_result.error = str(error)
+        task_result.completed_at = datetime.now()
+        
+        # 计算执行时间
+        execution_time = None
+        if task_result.started_at:
+            execution_time = (task_result.completed_at - task_result.started_at).total_seconds()
+        
+        # 更新数据库
+        await self._update_task_in_db(
+            task_id,
+            status="failed",
+            completed_at=task_result.completed_at,
+            error_message=str(error),
+            execution_time=execution_time
+        )
+        
+        logger.error(f"任务 {task_id} 执行失败: {error}")
+    
+    def _cleanup_after_task(self, task_id: str) -> None:
+        """任务执行完成后强制清理内存（额外保障）"""
+        try:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+                # 同步确保内存完全释放
+                torch.cuda.synchronize()
+            log_memory_status(f"[任务队列] 任务 {task_id[:8]} 完成后")
+        except Exception as cleanup_error:
+            logger.warning(f"内存清理时发生警告: {cleanup_error}")
     
     async def _save_task_to_db(
         self,
@@ -478,7 +614,7 @@ class TaskQueue:
                 db.add(task_history)
                 await db.commit()
                 
-            logger.debug(f"任务 {task_id} 已保存到数据库")
+            logger.debug("任务 %s 已保存到数据库", task_id)
             
         except Exception as e:
             logger.error(f"保存任务到数据库失败: {e}")
@@ -522,7 +658,7 @@ class TaskQueue:
                         task_history.execution_time = execution_time
                     
                     await db.commit()
-                    logger.debug(f"任务 {task_id} 数据库状态已更新")
+                    logger.debug("任务 %s 数据库状态已更新", task_id)
                     
         except Exception as e:
             logger.error(f"更新数据库任务状态失败: {e}")
@@ -537,6 +673,8 @@ class TaskQueue:
         _negative_prompt: Optional[str] = None,
         _parameters: Optional[Dict[str, Any]] = None,
         _user_id: Optional[int] = None,
+        _batch_key: Optional[tuple] = None,
+        _batch_func: Optional[Callable] = None,
         **kwargs
     ) -> str:
         """
@@ -551,6 +689,8 @@ class TaskQueue:
             _negative_prompt: 负面提示词（元数据）
             _parameters: 其他参数（元数据）
             _user_id: 用户 ID（元数据）
+            _batch_key: 合批键，相同键的等待任务可合并执行
+            _batch_func: 合批执行函数，接收 kwargs 列表并按顺序返回结果列表
             **kwargs: 关键字参数（传递给执行函数）
         
         Returns:
@@ -579,6 +719,8 @@ class TaskQueue:
             negative_prompt=negative_prompt,
             parameters=parameters,
             user_id=user_id,
+            batch_key=_batch_key,
+            batch_func=_batch_func,
         )
         
         # 创建任务结果记录
@@ -608,7 +750,7 @@ class TaskQueue:
                 parameters=parameters,
             )
         
-        logger.info(f"任务已提交 {task_id} | 队列位置: {task_result.position_in_queue}")
+        logger.info("任务已提交 %s | 队列位置: %d", task_id, task_result.position_in_queue)
         
         return task_id
     
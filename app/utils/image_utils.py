@@ -3,12 +3,16 @@
 """
 
 import os
-import io
 import uuid
+import hashlib
 import time
 import zipfile
 import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional, Tuple
 
@@ -82,6 +86,87 @@ def validate_image_file(
     # 注意：这会消耗文件内容，调用后需要重置文件指针或使用返回的内容
 
 
+# 上传内容分块读取大小；超过 _UPLOAD_SPOOL_SIZE 的内容落盘，避免整体驻留内存
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+_UPLOAD_SPOOL_SIZE = 4 * 1024 * 1024
+
+
+def _upload_too_large(max_size_mb: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"文件大小超过限制: > {max_size_mb}MB"
+    )
+
+
+async def copy_upload_limited(file: UploadFile, dst, max_size_mb: int, digest=None) -> int:
+    """
+    分块将上传内容写入 dst，累计超过大小限制时立即停止
+    
+    Args:
+        file: 上传的文件
+        dst: 可写的文件对象
+        max_size_mb: 最大文件大小（MB）
+        digest: 可选的 hashlib 对象，随读取同步更新内容摘要
+    
+    Returns:
+        写入的字节数
+    
+    Raises:
+        HTTPException: 超过大小限制时抛出 413
+    """
+    max_size_bytes = max_size_mb * 1024 * 1024
+    # 客户端声明了大小时提前拒绝，无需读取内容
+    if file.size is not None and file.size > max_size_bytes:
+        raise _upload_too_large(max_size_mb)
+    
+    total = 0
+    while True:
+        chunk = await file.read(_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_size_bytes:
+            raise _upload_too_large(max_size_mb)
+        if digest is not None:
+            digest.update(chunk)
+        dst.write(chunk)
+    return total
+
+
+# 已解码上传图像的 LRU 缓存: sha256 -> RGB 图像；仅在事件循环中访问，按解码后字节数限额
+_decoded_image_cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+_decoded_image_cache_bytes = 0
+
+
+def _image_nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def _get_cached_image(key: str) -> Optional[Image.Image]:
+    image = _decoded_image_cache.get(key)
+    if image is None:
+        return None
+    _decoded_image_cache.move_to_end(key)
+    # 调用方可能 close 返回的图像，缓存中保留原图
+    return image.copy()
+
+
+def _put_cached_image(key: str, image: Image.Image) -> None:
+    global _decoded_image_cache_bytes
+    max_bytes = settings.generation.upload_image_cache_mb * 1024 * 1024
+    nbytes = _image_nbytes(image)
+    if nbytes > max_bytes:
+        return
+    old = _decoded_image_cache.pop(key, None)
+    if old is not None:
+        _decoded_image_cache_bytes -= _image_nbytes(old)
+    _decoded_image_cache[key] = image.copy()
+    _decoded_image_cache_bytes += nbytes
+    while _decoded_image_cache_bytes > max_bytes:
+        _, evicted = _decoded_image_cache.popitem(last=False)
+        _decoded_image_cache_bytes -= _image_nbytes(evicted)
+
+
 async def read_and_validate_image(
     file: UploadFile,
     allowed_types: List[str],
@@ -108,33 +193,97 @@ async def read_and_validate_image(
             detail=f"不支持的文件类型: {file.content_type}。支持的类型: {allowed_types}"
         )
     
-    # 读取文件内容
-    content = await file.read()
-    
-    # 检查文件大小
-    max_size_bytes = max_size_mb * 1024 * 1024
-    if len(content) > max_size_bytes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"文件大小超过限制: {len(content) / 1024 / 1024:.2f}MB > {max_size_mb}MB"
-        )
-    
-    # 尝试打开图像
-    try:
-        image = Image.open(io.BytesIO(content)).convert("RGB")
-        return image
-    except Exception as e:
-        logger.error(f"无法打开图像文件: {e}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"无法解析图像文件: {str(e)}"
-        )
+    with tempfile.SpooledTemporaryFile(max_size=_UPLOAD_SPOOL_SIZE) as buffer:
+        # 分块读取并检查文件大小，同时计算内容摘要
+        digest = hashlib.sha256()
+        await copy_upload_limited(file, buffer, max_size_mb, digest=digest)
+        
+        # 相同内容的图像重复上传时直接复用解码结果
+        cache_key = digest.hexdigest()
+        cached = _get_cached_image(cache_key)
+        if cached is not None:
+            return cached
+        
+        buffer.seek(0)
+        
+        # 尝试打开图像
+        try:
+            image = Image.open(buffer)
+            if image.format == "JPEG":
+                # pipeline 会把输入缩放到约默认尺寸，JPEG 可在 IDCT 阶段直接按 1/2、1/4、1/8 解码
+                # draft 保证结果不小于目标尺寸
+                image.draft(
+                    "RGB",
+                    (settings.generation.default_width, settings.generation.default_height),
+                )
+            image = image.convert("RGB")
+        except Exception as e:
+            logger.error(f"无法打开图像文件: {e}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"无法解析图像文件: {str(e)}"
+            )
+    
+    _put_cached_image(cache_key, image)
+    return image
+
+
+@lru_cache(maxsize=1)
+def _get_save_executor() -> ThreadPoolExecutor:
+    """图像编码线程池；PNG 的 DEFLATE 压缩会释放 GIL，多张图像可并行编码"""
+    return ThreadPoolExecutor(
+        max_workers=min(8, os.cpu_count() or 1),
+        thread_name_prefix="image_save",
+    )
+
+
+# 输出格式 -> (PIL 格式名, 文件扩展名)
+_OUTPUT_FORMATS = {
+    "png": ("PNG", "png"),
+    "jpeg": ("JPEG", "jpg"),
+    "jpg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+}
+
+# 文件扩展名 -> MIME 类型
+_IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+def get_image_media_type(filename: str) -> str:
+    """根据文件扩展名获取图像 MIME 类型"""
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return _IMAGE_MEDIA_TYPES.get(ext, "image/png")
+
+
+def _get_save_options(format: str) -> dict:
+    """获取图像编码参数"""
+    format = format.upper()
+    if format == "PNG":
+        return {"compress_level": settings.storage.png_compress_level}
+    if format == "JPEG":
+        return {"quality": settings.storage.output_quality, "optimize": False, "progressive": False}
+    if format == "WEBP":
+        return {"quality": settings.storage.output_quality, "method": 4}
+    return {}
+
+
+def _resolve_output_format(format: Optional[str]) -> Tuple[str, str]:
+    """解析输出格式，返回 (PIL 格式名, 文件扩展名)"""
+    return _OUTPUT_FORMATS.get(
+        (format or settings.storage.output_format).lower(),
+        _OUTPUT_FORMATS["png"],
+    )
 
 
 def save_image_to_temp(
     image: Image.Image,
     prefix: str = "generated",
-    format: str = "PNG",
+    format: Optional[str] = None,
     user_id: Optional[int] = None,
 ) -> Tuple[str, str]:
     """
@@ -143,7 +292,7 @@ def save_image_to_temp(
     Args:
         image: PIL Image对象
         prefix: 文件名前缀
-        format: 图像格式
+        format: 图像格式 (png/jpeg/webp)，默认使用配置的输出格式
         user_id: 用户ID（可选，用于按用户组织目录）
     
     Returns:
@@ -151,46 +300,82 @@ def save_image_to_temp(
     """
     # 使用持久化输出目录
     output_dir = get_output_dir(user_id)
+    format, ext = _resolve_output_format(format)
     
     # 生成唯一文件名（包含时间戳和UUID）
     timestamp = datetime.now().strftime("%H%M%S")
-    filename = f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.{format.lower()}"
-    filepath = output_dir / filename
+    filename = f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.{ext}"
+    filepath = str(output_dir / filename)
     
-    image.save(str(filepath), format)
-    logger.debug(f"图像已保存到: {filepath}")
+    image.save(filepath, format, **_get_save_options(format))
+    logger.debug("图像已保存到: %s", filepath)
     
-    return str(filepath), filename
+    return filepath, filename
+
+
+@dataclass(slots=True)
+class SavedImages:
+    """批量保存结果：文件路径与文件名两个并行列表"""
+    paths: List[str] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.paths)
+    
+    def append(self, path: str, name: str) -> None:
+        self.paths.append(path)
+        self.names.append(name)
+    
+    def extend(self, other: "SavedImages") -> None:
+        self.paths.extend(other.paths)
+        self.names.extend(other.names)
 
 
 def save_images_to_temp(
     images: List[Image.Image],
     prefix: str = "generated",
-    format: str = "PNG",
+    format: Optional[str] = None,
     user_id: Optional[int] = None,
-) -> List[Tuple[str, str]]:
+    start_index: int = 0,
+    batch_id: Optional[str] = None,
+) -> SavedImages:
     """
     批量保存图像到持久化目录
     
     Args:
         images: PIL Image对象列表
         prefix: 文件名前缀
-        format: 图像格式
+        format: 图像格式 (png/jpeg/webp)，默认使用配置的输出格式
         user_id: 用户ID（可选，用于按用户组织目录）
+        start_index: 文件名起始序号（分块保存同一批结果时使用）
+        batch_id: 批次 ID（可选，分块保存同一批结果时共用）
     
     Returns:
-        [(文件路径, 文件名), ...] 列表
+        SavedImages，paths 与 names 按输入顺序一一对应
     """
-    results = []
-    for i, image in enumerate(images):
-        filepath, filename = save_image_to_temp(
-            image,
-            prefix=f"{prefix}_{i}",
-            format=format,
-            user_id=user_id,
-        )
-        results.append((filepath, filename))
-    return results
+    # 目录、格式、时间戳和 UUID 每批只生成一次，文件名以序号区分
+    output_dir = str(get_output_dir(user_id))
+    format, ext = _resolve_output_format(format)
+    save_options = _get_save_options(format)
+    timestamp = datetime.now().strftime("%H%M%S")
+    batch_id = batch_id or uuid.uuid4().hex[:8]
+    
+    names = [
+        f"{prefix}_{start_index + i}_{timestamp}_{batch_id}.{ext}" for i in range(len(images))
+    ]
+    saved = SavedImages([os.path.join(output_dir, name) for name in names], names)
+    
+    def _save(index: int) -> None:
+        images[index].save(saved.paths[index], format, **save_options)
+    
+    if len(images) == 1:
+        _save(0)
+    else:
+        # 多张图像并行编码
+        list(_get_save_executor().map(_save, range(len(images))))
+    
+    logger.debug("已保存 %d 张图像到: %s", len(images), output_dir)
+    return saved
 
 
 def create_zip_from_images(
@@ -218,13 +403,14 @@ def create_zip_from_images(
     
     zip_path = output_dir / zip_name
     
-    with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_DEFLATED) as zipf:
+    # PNG/JPEG/WebP 已是压缩数据，再做 DEFLATE 几乎不减小体积，直接存储
+    with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_STORED) as zipf:
         for path in image_paths:
             if os.path.exists(path):
                 arcname = os.path.basename(path)
                 zipf.write(path, arcname)
     
-    logger.debug(f"ZIP文件已创建: {zip_path}")
+    logger.debug("ZIP文件已创建: %s", zip_path)
     return str(zip_path)
 
 
@@ -259,32 +445,12 @@ def cleanup_old_output_files(
         return 0
     
     max_age_seconds = retention_days * 24 * 3600
-    current_time = time.time()
+    cutoff = time.time() - max_age_seconds
     cleaned_count = 0
     
     try:
-        # 递归遍历所有文件
-        for filepath in output_dir.rglob("*"):
-            if not filepath.is_file():
-                continue
-            
-            # 检查文件名是否匹配模式
-            if not any(filepath.name.startswith(p) for p in patterns):
-                continue
-            
-            # 检查文件年龄
-            file_age = current_time - filepath.stat().st_mtime
-            if file_age > max_age_seconds:
-                try:
-                    filepath.unlink()
-                    cleaned_count += 1
-                    logger.debug(f"已清理过期文件: {filepath}")
-                except OSError as e:
-                    logger.warning(f"无法删除文件 {filepath}: {e}")
-        
-        # 清理空目录
-        _cleanup_empty_dirs(output_dir)
-    
+        # 递归遍历所有文件，同时清理空目录
+        cleaned_count = _cleanup_dir(str(output_dir), tuple(patterns), cutoff, is_root=True)
     except Exception as e:
         logger.error(f"清理输出文件时出错: {e}")
     
@@ -294,22 +460,52 @@ def cleanup_old_output_files(
     return cleaned_count
 
 
-def _cleanup_empty_dirs(base_dir: Path) -> None:
+def _cleanup_dir(path: str, patterns: Tuple[str, ...], cutoff: float, is_root: bool = False) -> int:
     """
-    递归清理空目录
+    递归清理目录下的过期文件，子目录处理完后若已为空则删除
+    
+    使用 os.scandir，DirEntry 会缓存目录项类型，每个文件只需一次 stat
     
     Args:
-        base_dir: 基础目录
+        path: 目录路径
+        patterns: 文件名前缀元组
+        cutoff: 修改时间早于该时间戳的文件视为过期
+        is_root: 是否为输出根目录（根目录本身不删除）
+    
+    Returns:
+        清理的文件数量
     """
-    for dirpath in sorted(base_dir.rglob("*"), reverse=True):
-        if dirpath.is_dir():
-            try:
-                # 尝试删除空目录
-                dirpath.rmdir()
-                logger.debug(f"已清理空目录: {dirpath}")
-            except OSError:
-                # 目录非空，跳过
-                pass
+    cleaned_count = 0
+    
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                cleaned_count += _cleanup_dir(entry.path, patterns, cutoff)
+                continue
+            
+            # 检查文件名是否匹配模式
+            if not entry.name.startswith(patterns) or not entry.is_file(follow_symlinks=False):
+                continue
+            
+            # 检查文件年龄
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                    cleaned_count += 1
+                    logger.debug("已清理过期文件: %s", entry.path)
+                except OSError as e:
+                    logger.warning(f"无法删除文件 {entry.path}: {e}")
+    
+    if not is_root:
+        try:
+            # 尝试删除空目录
+            os.rmdir(path)
+            logger.debug("已清理空目录: %s", path)
+        except OSError:
+            # 目录非空，跳过
+            pass
+    
+    return cleaned_count
 
 
 # 保留旧函数名作为别名，保持向后兼容
@@ -0,0 +1,92 @@
+"""
+视频处理工具模块
+"""
+
+import functools
+import os
+from typing import Any, List, Set
+
+import numpy as np
+
+from .logger import get_logger
+from ..config import settings
+
+logger = get_logger(__name__)
+
+
+def _to_rgb24(frame: Any) -> np.ndarray:
+    """将 PIL 图像或 [0, 1] 浮点数组统一转换为 uint8 RGB 数组"""
+    array = np.asarray(frame)
+    if array.dtype != np.uint8:
+        array = (np.clip(array, 0.0, 1.0) * 255).round().astype(np.uint8)
+    return array
+
+
+def _encode_with_pyav(frames: List[Any], file_path: str, fps: int, codec: str) -> None:
+    """使用 PyAV 按指定编码器写出 MP4"""
+    import av
+
+    first = _to_rgb24(frames[0])
+    height, width = first.shape[:2]
+
+    with av.open(file_path, mode="w") as container:
+        stream = container.add_stream(codec, rate=fps)
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = "yuv420p"
+
+        for frame in frames:
+            video_frame = av.VideoFrame.from_ndarray(_to_rgb24(frame), format="rgb24")
+            for packet in stream.encode(video_frame):
+                container.mux(packet)
+
+        # 刷新编码器缓冲
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+# 运行时打开失败的编码器（如无 GPU 的主机上的 h264_nvenc），后续请求直接回退
+_failed_codecs: Set[str] = set()
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_codec(codec: str) -> bool:
+    """检查 PyAV 是否可用且包含指定编码器；每个编码器只检查并记录一次"""
+    try:
+        import av
+        av.codec.Codec(codec, "w")
+    except (ImportError, ValueError) as e:
+        logger.warning(f"视频编码器 {codec} 不可用，使用 CPU 编码: {e}")
+        return False
+    return True
+
+
+def export_video(frames: List[Any], file_path: str, fps: int = 8) -> str:
+    """
+    将视频帧编码为 MP4
+
+    设置 VIDEO_CODEC（如 h264_nvenc，GPU 硬件编码，不占用 CPU）且已安装 PyAV 时使用该编码器；
+    未设置或编码器不可用时使用 diffusers 的 export_to_video (CPU 编码)
+
+    Args:
+        frames: 视频帧列表（PIL 图像或 numpy 数组）
+        file_path: 输出文件路径
+        fps: 帧率
+
+    Returns:
+        输出文件路径
+    """
+    codec = settings.generation.video_codec
+    if codec and codec not in _failed_codecs and _probe_codec(codec):
+        import av
+        try:
+            _encode_with_pyav(frames, file_path, fps, codec)
+            return file_path
+        except av.error.FFmpegError as e:
+            _failed_codecs.add(codec)
+            logger.warning(f"视频编码器 {codec} 打开失败，后续使用 CPU 编码: {e}")
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+    from diffusers.utils import export_to_video
+    return export_to_video(frames, file_path, fps=fps)